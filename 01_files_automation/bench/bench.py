@@ -0,0 +1,278 @@
+"""
+Benchmark harness for the file sorter.
+
+Generates synthetic trees under a temp dir, runs tool.py in each mode
+(sort, dry-run sort, replay, undo) with and without --dedupe/--plan-fsync,
+times build_dedupe_index in-process, and prints one JSON document:
+
+    python 01_files_automation/bench/bench.py --scale 0.2 --out bench.json
+
+Mode timings are wall clock for a fresh `python tool.py` process, so they
+include interpreter start-up; the RUN_END summary of each run is copied
+into the result as-is.
+"""
+from __future__ import annotations
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+HERE = Path(__file__).resolve().parent
+TOOL_DIR = HERE.parent
+sys.path.insert(0, str(TOOL_DIR))
+
+from runner import build_dedupe_index  # noqa: E402
+
+
+# -----------------------
+# synthetic trees
+# -----------------------
+
+def _write(p: Path, data: bytes) -> None:
+    p.parent.mkdir(parents=True, exist_ok=True)
+    with open(p, "wb") as f:
+        f.write(data)
+
+
+def gen_tiny(root: Path, rng: random.Random, scale: float) -> None:
+    """Many tiny files spread over a flat-ish tree."""
+    n = max(1, int(20000 * scale))
+    exts = ["txt", "json", "md", "csv", "log", ""]
+    for i in range(n):
+        ext = rng.choice(exts)
+        name = f"t{i}.{ext}" if ext else f"t{i}"
+        _write(root / f"d{i % 100}" / name, rng.randbytes(rng.randint(0, 512)))
+
+
+def gen_huge(root: Path, rng: random.Random, scale: float) -> None:
+    """A few large files (so data copy dominates)."""
+    size = max(1 << 20, int((256 << 20) * scale))
+    block = rng.randbytes(1 << 20)
+    for i in range(4):
+        p = root / f"big{i}.bin"
+        p.parent.mkdir(parents=True, exist_ok=True)
+        with open(p, "wb") as f:
+            left = size
+            while left > 0:
+                n = min(left, len(block))
+                f.write(block[:n])
+                left -= n
+            f.write(str(i).encode())  # keep them distinct
+
+
+def gen_collisions(root: Path, rng: random.Random, scale: float) -> None:
+    """The same few names in many directories -> heavy rename traffic."""
+    dirs = max(1, int(500 * scale))
+    for d in range(dirs):
+        for i in range(10):
+            _write(root / f"d{d}" / f"IMG_{i:04d}.jpg", rng.randbytes(rng.randint(64, 4096)))
+
+
+def gen_deep(root: Path, rng: random.Random, scale: float) -> None:
+    """Long directory chains with a few files at every level."""
+    chains = max(1, int(100 * scale))
+    for c in range(chains):
+        d = root / f"c{c}"
+        for depth in range(30):
+            d = d / f"l{depth}"
+            for i in range(2):
+                _write(d / f"f{c}_{depth}_{i}.dat", rng.randbytes(rng.randint(16, 2048)))
+
+
+def gen_dups(root: Path, rng: random.Random, scale: float) -> None:
+    """Mostly duplicate content, mixed sizes (exercises every dedupe tier)."""
+    n = max(1, int(10000 * scale))
+    pool = [rng.randbytes(rng.choice([100, 4096, 200_000])) for _ in range(50)]
+    for i in range(n):
+        data = rng.choice(pool) if rng.random() < 0.7 else rng.randbytes(rng.choice([100, 4096, 200_000]))
+        _write(root / f"d{i % 50}" / f"dup{i}.bin", data)
+
+
+SCENARIOS: Dict[str, Callable[[Path, random.Random, float], None]] = {
+    "tiny": gen_tiny,
+    "huge": gen_huge,
+    "collisions": gen_collisions,
+    "deep": gen_deep,
+    "dups": gen_dups,
+}
+
+
+def tree_stats(root: Path) -> Dict[str, int]:
+    files = size = 0
+    for dirpath, dirnames, filenames in os.walk(root):
+        if "logs" in dirnames:
+            dirnames.remove("logs")
+        for n in filenames:
+            files += 1
+            size += os.path.getsize(os.path.join(dirpath, n))
+    return {"files": files, "bytes": size}
+
+
+# -----------------------
+# runs
+# -----------------------
+
+def _last_summary(plan: Path) -> Optional[Dict[str, Any]]:
+    summary = None
+    if plan.exists():
+        with open(plan, "r", encoding="utf-8") as f:
+            for line in f:
+                if '"RUN_END"' in line:
+                    summary = json.loads(line).get("summary")
+    return summary
+
+
+def _tool(args: List[str]) -> int:
+    cmd = [sys.executable, str(TOOL_DIR / "tool.py")] + args + ["--log-level", "ERROR"]
+    return subprocess.run(cmd, stdout=subprocess.DEVNULL).returncode
+
+
+def _result(name: str, mode: str, flags: Dict[str, bool], work: Dict[str, int], secs: float,
+            rc: int, summary: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "scenario": name,
+        "mode": mode,
+        **flags,
+        "files": work["files"],
+        "bytes": work["bytes"],
+        "seconds": round(secs, 4),
+        "files_per_s": round(work["files"] / secs, 1) if secs > 0 else None,
+        "mb_per_s": round(work["bytes"] / secs / 1e6, 2) if secs > 0 else None,
+        "rc": rc,
+        "summary": summary,
+    }
+
+
+def _timed(fn: Callable[[], Any]) -> tuple:
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0
+
+
+def bench_case(name: str, src: Path, work: Dict[str, int], case_dir: Path,
+               dedupe: bool, fsync: bool, workers: int) -> List[Dict[str, Any]]:
+    flags = {"dedupe": dedupe, "plan_fsync": fsync}
+    common = ["--recursive", "--workers", str(workers)]
+    if dedupe:
+        common += ["--dedupe"]
+    if fsync:
+        common += ["--plan-fsync"]
+    out: List[Dict[str, Any]] = []
+
+    # real sort (copy, so the source tree is reused by every case)
+    dst = case_dir / "sorted"
+    plan = case_dir / "sort.jsonl"
+    rc, secs = _timed(lambda: _tool(["--src", str(src), "--dst", str(dst), "--action", "copy",
+                                      "--plan-out", str(plan)] + common))
+    out.append(_result(name, "sort", flags, work, secs, rc, _last_summary(plan)))
+
+    if dedupe:
+        logger = logging.getLogger("bench")
+        idx, secs = _timed(lambda: build_dedupe_index(dst, logger))
+        out.append(_result(name, "build_dedupe_index", flags, tree_stats(dst), secs, 0, {"files": len(idx)}))
+        idx.close()
+
+    # dry-run sort -> replay -> undo
+    dst2 = case_dir / "replayed"
+    dry = case_dir / "dry.jsonl"
+    rc, secs = _timed(lambda: _tool(["--src", str(src), "--dst", str(dst2), "--action", "copy", "--dry-run",
+                                      "--plan-out", str(dry)] + common))
+    out.append(_result(name, "sort_dry", flags, work, secs, rc, _last_summary(dry)))
+
+    replayed = case_dir / "replay.jsonl"
+    replay_args = ["--replay", str(dry), "--plan-out", str(replayed), "--workers", str(workers)]
+    if dedupe:
+        replay_args += ["--dedupe", "--dst", str(dst2)]
+    if fsync:
+        replay_args += ["--plan-fsync"]
+    rc, secs = _timed(lambda: _tool(replay_args))
+    out.append(_result(name, "replay", flags, work, secs, rc, _last_summary(replayed)))
+
+    undone = case_dir / "undo.jsonl"
+    undo_args = ["--undo", str(replayed), "--plan-out", str(undone), "--workers", str(workers),
+                 "--trash-dir", str(case_dir / "trash")]
+    if fsync:
+        undo_args += ["--plan-fsync"]
+    rc, secs = _timed(lambda: _tool(undo_args))
+    out.append(_result(name, "undo", flags, work, secs, rc, _last_summary(undone)))
+    return out
+
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=TOOL_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="benchmark run_sort/run_replay/run_undo/build_dedupe_index")
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma list of: " + ",".join(SCENARIOS))
+    ap.add_argument("--scale", type=float, default=1.0, help="multiply tree sizes (e.g. 0.1 for a quick run)")
+    ap.add_argument("--workers", type=int, default=1, help="--workers passed to every run")
+    ap.add_argument("--seed", type=int, default=1234)
+    ap.add_argument("--tmp", default="", help="where to build trees (default: a new temp dir)")
+    ap.add_argument("--keep", action="store_true", help="keep generated trees")
+    ap.add_argument("--out", default="", help="write JSON here instead of stdout")
+    args = ap.parse_args()
+
+    names = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in names if s not in SCENARIOS]
+    if unknown:
+        ap.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    base = Path(args.tmp) if args.tmp else Path(tempfile.mkdtemp(prefix="sorter_bench_"))
+    base.mkdir(parents=True, exist_ok=True)
+    results: List[Dict[str, Any]] = []
+    try:
+        for name in names:
+            src = base / name / "src"
+            _, gen_secs = _timed(lambda: SCENARIOS[name](src, random.Random(args.seed), args.scale))
+            work = tree_stats(src)
+            print(f"[bench] {name}: {work['files']} files, {work['bytes']} bytes (gen {gen_secs:.1f}s)",
+                  file=sys.stderr)
+            for dedupe in (False, True):
+                for fsync in (False, True):
+                    case_dir = base / name / f"dedupe{int(dedupe)}_fsync{int(fsync)}"
+                    results.extend(bench_case(name, src, work, case_dir, dedupe, fsync, args.workers))
+                    shutil.rmtree(case_dir, ignore_errors=True)
+    finally:
+        if not args.keep:
+            if args.tmp:
+                # only what we generated; the dir itself is the caller's
+                for name in names:
+                    shutil.rmtree(base / name, ignore_errors=True)
+            else:
+                shutil.rmtree(base, ignore_errors=True)
+
+    doc = {
+        "git_rev": _git_rev(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "scale": args.scale,
+        "workers": args.workers,
+        "seed": args.seed,
+        "results": results,
+    }
+    text = json.dumps(doc, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+from __future__ import annotations
+import struct
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+# only these are opened at all; everything else falls back to mtime unread
+CAPTURE_EXTS = {
+    "jpg", "jpeg", "jpe", "heic", "heif", "hif", "avif",
+    "tif", "tiff", "dng", "nef", "arw", "cr2", "orf", "rw2", "pef",
+    "mp4", "m4v", "mov", "3gp", "qt",
+}
+
+HEAD = 64 * 1024          # bytes read from the start of a file
+_MP4_EPOCH = 2082844800   # 1904-01-01 -> 1970-01-01, in seconds
+
+_TAG_DATETIME = 0x0132
+_TAG_EXIF_IFD = 0x8769
+_TAG_ORIGINAL = 0x9003
+_TAG_DIGITIZED = 0x9004
+
+
+def capture_timestamp(p: Path) -> Optional[float]:
+    """
+    When the photo/video was taken, from its EXIF or container header.
+
+    Reads at most a few header blocks (never the whole file): JPEG APP1,
+    TIFF-based raws, the Exif item of HEIC/HEIF, and mvhd of MP4/MOV.
+    Returns None if the file has no usable timestamp.
+    """
+    if p.suffix.lower().lstrip(".") not in CAPTURE_EXTS:
+        return None
+    try:
+        with p.open("rb") as f:
+            head = f.read(HEAD)
+            if head[:2] == b"\xff\xd8":
+                return _jpeg(f, head)
+            if head[:4] in (b"II*\x00", b"MM\x00*"):
+                return _exif_time(head)
+            if head[4:8] in (b"ftyp", b"moov", b"mdat", b"wide", b"free"):
+                return _bmff(f)
+    except (OSError, struct.error, ValueError, IndexError):
+        pass
+    return None
+
+
+# -----------------------
+# EXIF (TIFF structure)
+# -----------------------
+
+def _exif_time(t: bytes) -> Optional[float]:
+    if t[:2] == b"II":
+        e = "<"
+    elif t[:2] == b"MM":
+        e = ">"
+    else:
+        return None
+
+    def entries(off: int) -> Iterator[Tuple[int, int, int, bytes]]:
+        (n,) = struct.unpack_from(e + "H", t, off)
+        for i in range(n):
+            yield struct.unpack_from(e + "HHI4s", t, off + 2 + 12 * i)
+
+    def ascii_at(typ: int, cnt: int, val: bytes) -> Optional[str]:
+        if typ != 2:
+            return None
+        if cnt <= 4:
+            data = val[:cnt]
+        else:
+            (off,) = struct.unpack(e + "I", val)
+            data = t[off:off + cnt]
+        return data.rstrip(b"\x00 ").decode("ascii", "replace")
+
+    (ifd0,) = struct.unpack_from(e + "I", t, 4)
+    found = {}
+    exif_ifd = None
+    for tag, typ, cnt, val in entries(ifd0):
+        if tag == _TAG_DATETIME:
+            found[tag] = ascii_at(typ, cnt, val)
+        elif tag == _TAG_EXIF_IFD:
+            (exif_ifd,) = struct.unpack(e + "I", val)
+    if exif_ifd is not None:
+        for tag, typ, cnt, val in entries(exif_ifd):
+            if tag in (_TAG_ORIGINAL, _TAG_DIGITIZED):
+                found[tag] = ascii_at(typ, cnt, val)
+
+    for tag in (_TAG_ORIGINAL, _TAG_DIGITIZED, _TAG_DATETIME):
+        ts = _parse_exif_dt(found.get(tag))
+        if ts is not None:
+            return ts
+    return None
+
+
+def _parse_exif_dt(s: Optional[str]) -> Optional[float]:
+    # "YYYY:MM:DD HH:MM:SS", camera local time; all-zero/blank means unset
+    if not s or len(s) < 19:
+        return None
+    try:
+        return datetime.strptime(s[:19], "%Y:%m:%d %H:%M:%S").timestamp()
+    except (ValueError, OverflowError, OSError):
+        return None
+
+
+# -----------------------
+# containers
+# -----------------------
+
+def _jpeg(f: BinaryIO, buf: bytes) -> Optional[float]:
+    i = 2
+    while i + 4 <= len(buf):
+        if buf[i] != 0xFF:
+            return None
+        marker = buf[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker in (0xD9, 0xDA):  # EOI / start of scan: no more metadata
+            return None
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            i += 2
+            continue
+        (seglen,) = struct.unpack_from(">H", buf, i + 2)
+        if marker == 0xE1 and buf[i + 4:i + 10] == b"Exif\x00\x00":
+            seg = buf[i + 10:i + 2 + seglen]
+            if len(seg) < seglen - 8:  # APP1 straddles our head block
+                f.seek(i + 10)
+                seg = f.read(seglen - 8)
+            return _exif_time(seg)
+        i += 2 + seglen
+    return None
+
+
+def _boxes(f: BinaryIO, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """(type, payload_start, box_end) for each ISO-BMFF box in [start, end)."""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        hdr = f.read(16)
+        if len(hdr) < 8:
+            return
+        size, typ = struct.unpack_from(">I4s", hdr)
+        hsz = 8
+        if size == 1:
+            (size,) = struct.unpack_from(">Q", hdr, 8)
+            hsz = 16
+        elif size == 0:
+            size = end - pos
+        if size < hsz:
+            return
+        yield typ, pos + hsz, pos + size
+        pos += size
+
+
+def _bmff(f: BinaryIO) -> Optional[float]:
+    f.seek(0, 2)
+    end = f.tell()
+    mvhd_ts = None
+    # only box headers are read while walking, so a trailing moov is cheap
+    for typ, start, stop in _boxes(f, 0, end):
+        if typ == b"meta":
+            ts = _heif_exif(f, start + 4, stop)  # meta is a full box
+            if ts is not None:
+                return ts
+        elif typ == b"moov":
+            mvhd_ts = _mvhd(f, start, stop)
+    return mvhd_ts
+
+
+def _mvhd(f: BinaryIO, start: int, stop: int) -> Optional[float]:
+    for typ, s, _e in _boxes(f, start, stop):
+        if typ == b"mvhd":
+            f.seek(s)
+            data = f.read(12)
+            created = struct.unpack_from(">Q" if data[0] == 1 else ">I", data, 4)[0]
+            return float(created - _MP4_EPOCH) if created > _MP4_EPOCH else None
+    return None
+
+
+def _heif_exif(f: BinaryIO, start: int, stop: int) -> Optional[float]:
+    exif_id = None
+    iloc = None
+    for typ, s, e in _boxes(f, start, stop):
+        if typ == b"iinf":
+            exif_id = _iinf_exif_id(f, s, e)
+        elif typ == b"iloc":
+            iloc = (s, e)
+    if exif_id is None or iloc is None:
+        return None
+    loc = _iloc_extent(f, iloc[0], iloc[1], exif_id)
+    if loc is None:
+        return None
+    off, length = loc
+    f.seek(off)
+    data = f.read(min(length, HEAD))
+    # Exif item payload: 4-byte offset to the TIFF header, then the data
+    (skip,) = struct.unpack_from(">I", data)
+    return _exif_time(data[4 + skip:])
+
+
+def _iinf_exif_id(f: BinaryIO, s: int, e: int) -> Optional[int]:
+    f.seek(s)
+    version = f.read(4)[0]
+    n_len = 2 if version == 0 else 4
+    for typ, bs, _be in _boxes(f, s + 4 + n_len, e):
+        if typ != b"infe":
+            continue
+        f.seek(bs)
+        data = f.read(16)
+        v = data[0]
+        if v < 2:
+            continue
+        if v == 2:
+            item_id = struct.unpack_from(">H", data, 4)[0]
+            item_type = data[8:12]
+        else:
+            item_id = struct.unpack_from(">I", data, 4)[0]
+            item_type = data[10:14]
+        if item_type == b"Exif":
+            return item_id
+    return None
+
+
+def _iloc_extent(f: BinaryIO, s: int, e: int, want: int) -> Optional[Tuple[int, int]]:
+    f.seek(s)
+    data = f.read(e - s)
+    version = data[0]
+    off_size, len_size = data[4] >> 4, data[4] & 0x0F
+    base_size, idx_size = data[5] >> 4, (data[5] & 0x0F if version in (1, 2) else 0)
+    pos = 6
+
+    def uint(n: int) -> int:
+        nonlocal pos
+        v = int.from_bytes(data[pos:pos + n], "big") if n else 0
+        pos += n
+        return v
+
+    count = uint(2 if version < 2 else 4)
+    for _ in range(count):
+        item_id = uint(2 if version < 2 else 4)
+        method = uint(2) & 0x0F if version in (1, 2) else 0
+        uint(2)  # data_reference_index
+        base = uint(base_size)
+        extents = uint(2)
+        first = None
+        for _ in range(extents):
+            uint(idx_size)
+            ext_off = uint(off_size)
+            ext_len = uint(len_size)
+            if first is None:
+                first = (base + ext_off, ext_len)
+        if item_id == want:
+            # only plain file offsets (method 0); idat/item refs are rare for Exif
+            return first if method == 0 else None
+    return None
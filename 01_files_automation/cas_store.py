@@ -0,0 +1,101 @@
+from __future__ import annotations
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, Set
+
+from dedupe import DEFAULT_HASH, IndexEntry, hash_file
+from hash_cache import HashCache
+
+OBJECTS_DIR = "objects"
+
+
+class ObjectStore:
+    """
+    Content-addressed store under <dst>/objects: every distinct content is
+    kept once, as objects/ab/cd/<digest>, and buckets hold hardlinks to it.
+
+    Whether a file's content is already stored is one existence check on
+    its object path (remembered for the run, including objects a dry run
+    only planned), so no dedupe index of dst is needed. Digests come from
+    the HashCache when the source is unchanged; with workers > 1 they can
+    be computed ahead of time via prefetch(), like DedupeIndex does.
+    """
+
+    def __init__(
+        self,
+        dst: Path,
+        algo: str = DEFAULT_HASH,
+        cache: Optional[HashCache] = None,
+        workers: int = 1,
+    ) -> None:
+        self.root = dst / OBJECTS_DIR
+        self.algo = algo
+        self.cache = cache
+        self._known: Set[str] = set()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        if workers > 1:
+            self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hash")
+        self.stats = {"objects_new": 0, "objects_reused": 0, "full_hashes": 0, "bytes_hashed": 0}
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def object_path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def has(self, obj: Path) -> bool:
+        key = str(obj)
+        if key in self._known:
+            return True
+        if os.path.exists(key):
+            self._known.add(key)
+            return True
+        return False
+
+    def add(self, obj: Path) -> None:
+        self._known.add(str(obj))
+
+    def forget(self, obj: Path) -> None:
+        self._known.discard(str(obj))
+
+    def count(self, new: bool) -> None:
+        self.stats["objects_new" if new else "objects_reused"] += 1
+
+    def prefetch(self, entry: IndexEntry) -> None:
+        if self._pool is None or entry.digest is not None or entry.fut is not None:
+            return
+        if self._cached(entry):
+            return
+        entry.fut = self._pool.submit(hash_file, entry.path, self.algo, entry.size)
+
+    def digest(self, entry: IndexEntry) -> str:
+        """Full digest of entry.path (cache, prefetched result, or hashed now)."""
+        if entry.digest is not None:
+            return entry.digest
+        if entry.fut is None and self._cached(entry):
+            return entry.digest
+        fut, entry.fut = entry.fut, None
+        digest = fut.result() if fut is not None else hash_file(entry.path, self.algo, entry.size)
+        entry.digest = digest
+        self.stats["full_hashes"] += 1
+        self.stats["bytes_hashed"] += entry.size
+        if self.cache is not None:
+            self.cache.put(entry.path, self._stat(entry), digest, "full")
+        return digest
+
+    def _stat(self, entry: IndexEntry) -> os.stat_result:
+        if entry.st is None:
+            entry.st = entry.path.stat()
+        return entry.st
+
+    def _cached(self, entry: IndexEntry) -> bool:
+        if self.cache is None:
+            return False
+        digest = self.cache.get(entry.path, self._stat(entry), "full")
+        if digest is None:
+            return False
+        entry.digest = digest
+        return True
@@ -1,7 +1,10 @@
 from __future__ import annotations
+import re
+import time
 from dataclasses import dataclass
+from datetime import datetime
 from pathlib import Path
-from typing import Optional, Set, Dict, Any
+from typing import Optional, Set, Dict, Any, Tuple, Union
 
 def parse_ext_list(s: str) -> Set[str]:
     if not s:
@@ -15,28 +18,69 @@ def parse_ext_list(s: str) -> Set[str]:
             out.add(part)
     return out
 
+_AGE = re.compile(r"^(\d+(?:\.\d+)?)([smhdw])$")
+_AGE_SECS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+
+def parse_time_bound(s: Union[str, float, int, None]) -> Optional[float]:
+    """
+    '' -> None; '7d' / '12h' / '30m' -> that long ago; 'YYYY-MM-DD[THH:MM[:SS]]'
+    -> local time; a number is taken as an epoch timestamp (as saved in plans).
+    """
+    if s is None or s == "":
+        return None
+    if isinstance(s, (int, float)):
+        return float(s)
+    m = _AGE.match(s.strip().lower())
+    if m:
+        return time.time() - float(m.group(1)) * _AGE_SECS[m.group(2)]
+    return datetime.fromisoformat(s.strip()).timestamp()
+
 @dataclass(frozen=True)
 class RunConfig:
     src: Path
     dst: Path
     recursive: bool
-    mode: str       # 'ext' | 'date'
+    mode: str       # 'ext' | 'date' | 'capture-date'
     action: str     # 'move' | 'copy'
     dry_run: bool
+    workers: int
+
+    watch: bool
+    watch_interval: float   # seconds between polls
+    watch_quiet: float      # seconds a file must sit unchanged
 
     only_ext: Set[str]
     exclude_ext: Set[str]
     min_size_kb: int
+    max_size_kb: int                  # 0 = no limit
+    include: Tuple[str, ...]          # glob or "re:" patterns on the path under src
+    exclude: Tuple[str, ...]
+    exclude_dir: Tuple[str, ...]      # directories pruned from the scan
+    mtime_after: Optional[float]      # epoch seconds
+    mtime_before: Optional[float]
+    skip_log: str                     # 'events' | 'summary'
 
     plan_out: Optional[Path]
+    resume: Optional[Path]
     plan_fsync: bool
+    plan_batch: int
+    plan_batch_ms: int
 
     on_conflict: str
     dedupe: bool
-
+    dedupe_action: str              # 'skip' | 'link' | 'reflink'
+    store: str                      # 'plain' | 'cas' (objects/ab/cd/<digest> + hardlinked buckets)
+    hash_cache: Optional[Path]
+    hash_workers: int
+    hash_algo: str                  # hashlib name, see dedupe.HASH_ALGOS
+    dedupe_spill: int               # index files kept in memory before spilling to sqlite; 0 = never
+    scan_snapshot: Optional[Path]   # --incremental-scan; None = full walks
     log_file: Optional[Path]
     console_level: int
     file_level: int
+    log_queue: int                  # 0 = log synchronously; N = bounded queue + listener thread
+    log_queue_policy: str           # 'block' | 'drop' when the queue is full
+    progress_every: float           # seconds between progress lines; 0 = off
 
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -46,13 +90,34 @@ class RunConfig:
             "mode": self.mode,
             "action": self.action,
             "dry_run": self.dry_run,
+            "workers": self.workers,
+            "watch": self.watch,
+            "watch_interval": self.watch_interval,
+            "watch_quiet": self.watch_quiet,
             "only_ext": sorted(self.only_ext),
             "exclude_ext": sorted(self.exclude_ext),
             "min_size_kb": self.min_size_kb,
+            "max_size_kb": self.max_size_kb,
+            "include": list(self.include),
+            "exclude": list(self.exclude),
+            "exclude_dir": list(self.exclude_dir),
+            "mtime_after": self.mtime_after,
+            "mtime_before": self.mtime_before,
+            "skip_log": self.skip_log,
             "on_conflict": self.on_conflict,
             "dedupe": self.dedupe,
+            "dedupe_action": self.dedupe_action,
+            "store": self.store,
+            "hash_cache": str(self.hash_cache) if self.hash_cache else None,
+            "hash_workers": self.hash_workers,
+            "hash_algo": self.hash_algo,
+            "dedupe_spill": self.dedupe_spill,
+            "scan_snapshot": str(self.scan_snapshot) if self.scan_snapshot else None,
             "plan_out": str(self.plan_out) if self.plan_out else None,
+            "resume": str(self.resume) if self.resume else None,
             "plan_fsync": self.plan_fsync,
+            "plan_batch": self.plan_batch,
+            "plan_batch_ms": self.plan_batch_ms,
             "log_file": str(self.log_file) if self.log_file else None,
         }
 
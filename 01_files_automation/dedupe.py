@@ -0,0 +1,584 @@
+from __future__ import annotations
+import hashlib
+import mmap
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
+from os import stat_result
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from hash_cache import HashCache
+
+
+Sig = Tuple[int, str]  # (size_bytes, digest)
+
+# hashlib algorithms accepted by --hash; the digest goes into plan events
+# under the algorithm's name (e.g. "sha256": ...)
+HASH_ALGOS = ("sha256", "blake2b", "blake2s", "sha512", "sha1")
+DEFAULT_HASH = "sha256"
+
+PARTIAL_BLOCK = 64 * 1024
+CHUNK = 1024 * 1024
+MMAP_MIN = 8 * 1024 * 1024  # dst files at least this big are hashed through mmap
+SPILL_BATCH = 10000         # rows buffered before an insert into the spill table
+
+_tls = threading.local()
+
+
+def _buffer() -> bytearray:
+    # one read buffer per (hashing) thread, reused for every file
+    buf = getattr(_tls, "buf", None)
+    if buf is None:
+        buf = _tls.buf = bytearray(CHUNK)
+    return buf
+
+
+def _update_from(h: Any, f: BinaryIO, limit: int = -1) -> None:
+    buf = _buffer()
+    mv = memoryview(buf)
+    while limit != 0:
+        n = f.readinto(mv if limit < 0 or limit >= len(buf) else mv[:limit])
+        if not n:
+            break
+        h.update(mv[:n])
+        if limit > 0:
+            limit -= n
+
+
+def hash_file(p: Path, algo: str = DEFAULT_HASH, size: int = -1, use_mmap: bool = False) -> str:
+    """
+    Full-content digest, read into a reused per-thread buffer. With
+    use_mmap, big files are fed to hashlib as one mmap instead (no copies,
+    GIL released for the whole file). Only do that for files this tool
+    owns: if another process truncates a mapped file mid-hash, the read
+    faults with SIGBUS and kills the process, not just this file.
+    """
+    h = hashlib.new(algo)
+    with p.open("rb") as f:
+        if size < 0:
+            size = os.fstat(f.fileno()).st_size
+        if use_mmap and size >= MMAP_MIN:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    h.update(mm)
+                return h.hexdigest()
+            except (OSError, ValueError):
+                # not mappable (special file, shrunk to 0, ...): plain reads
+                h = hashlib.new(algo)
+                f.seek(0)
+        _update_from(h, f)
+    return h.hexdigest()
+
+
+def partial_digest(p: Path, size: int, algo: str = DEFAULT_HASH, block: int = PARTIAL_BLOCK) -> str:
+    """
+    Hash the head and tail blocks of a file.
+
+    Files no larger than two blocks are hashed whole, so for them the
+    partial digest IS the full digest.
+    """
+    if size <= 2 * block:
+        return hash_file(p, algo, size)
+    h = hashlib.new(algo)
+    with p.open("rb") as f:
+        _update_from(h, f, block)
+        f.seek(size - block)
+        _update_from(h, f, block)
+    return h.hexdigest()
+
+
+class IndexEntry:
+    """
+    One file known to the dedupe index.
+
+    `path` is where the content can be read right now, `report` is what
+    goes into `duplicate_of` (they differ for dry-run items, whose content
+    still sits at src). Digests are filled in lazily and kept as raw
+    bytes; `partial` / `digest` read and write them as hex.
+    """
+    __slots__ = ("path", "report", "size", "st", "_partial", "_digest", "fut")
+
+    def __init__(self, path: Path, size: int, st: Optional[stat_result] = None) -> None:
+        self.path = path
+        self.report = path
+        self.size = size
+        self.st = st
+        self._partial: Optional[bytes] = None
+        self._digest: Optional[bytes] = None
+        self.fut: Optional[Future] = None  # in-flight prefetch of the partial digest
+
+    @property
+    def partial(self) -> Optional[str]:
+        return self._partial.hex() if self._partial is not None else None
+
+    @partial.setter
+    def partial(self, hexdigest: Optional[str]) -> None:
+        self._partial = bytes.fromhex(hexdigest) if hexdigest is not None else None
+
+    @property
+    def digest(self) -> Optional[str]:
+        return self._digest.hex() if self._digest is not None else None
+
+    @digest.setter
+    def digest(self, hexdigest: Optional[str]) -> None:
+        self._digest = bytes.fromhex(hexdigest) if hexdigest is not None else None
+
+    @property
+    def sig(self) -> Optional[Sig]:
+        return (self.size, self.digest) if self._digest is not None else None
+
+    def relocate(self, path: Path, report: Optional[Path] = None) -> None:
+        self.path = path
+        self.report = report if report is not None else path
+        self.st = None
+
+
+class _SizeGroup:
+    __slots__ = ("pending", "by_partial")
+
+    def __init__(self) -> None:
+        self.pending: List[IndexEntry] = []
+        self.by_partial: Dict[bytes, List[IndexEntry]] = {}
+
+
+class _ColdFiles:
+    """
+    Files known only by size (nothing read yet), which is most of a big
+    dst. Stored packed: each directory string once, each file as a name
+    plus a directory id, no Path or IndexEntry objects.
+
+    Past `spill_at` files (0 = never) the records move to a sqlite table
+    in a temp file under `spill_dir`, and later adds go there too; a
+    bitmap over sizes answers most "no such size" checks without a query.
+    """
+
+    _BITS = 1 << 24
+
+    def __init__(self, spill_at: int = 0, spill_dir: Optional[Path] = None) -> None:
+        self.spill_at = spill_at
+        self.spill_dir = spill_dir
+        self._dirs: List[str] = []
+        self._dir_ids: Dict[str, int] = {}
+        self._rec_dir = array("L")
+        self._rec_name: List[Optional[str]] = []
+        self._by_size: Dict[int, Union[int, List[int]]] = {}
+        self._count = 0
+        self.spill_path: Optional[Path] = None
+        self._db: Optional[sqlite3.Connection] = None
+        self._bits: Optional[bytearray] = None
+        self._buf: List[Tuple[int, int, str]] = []
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, size: int) -> bool:
+        if self._db is None:
+            return size in self._by_size
+        h = (size * 2654435761) % self._BITS
+        if not self._bits[h >> 3] & (1 << (h & 7)):
+            return False
+        self._flush()
+        return self._db.execute("SELECT 1 FROM f WHERE size = ? LIMIT 1", (size,)).fetchone() is not None
+
+    def add(self, p: Path, size: int) -> None:
+        d, name = os.path.split(str(p))
+        dir_id = self._dir_ids.get(d)
+        if dir_id is None:
+            dir_id = self._dir_ids[d] = len(self._dirs)
+            self._dirs.append(d)
+        self._count += 1
+        if self._db is not None:
+            self._spill_row(size, dir_id, name)
+            return
+        rec = len(self._rec_name)
+        self._rec_dir.append(dir_id)
+        self._rec_name.append(name)
+        prev = self._by_size.get(size)
+        if prev is None:
+            self._by_size[size] = rec
+        elif isinstance(prev, int):
+            self._by_size[size] = [prev, rec]
+        else:
+            prev.append(rec)
+        if self.spill_at and self._count > self.spill_at:
+            self._spill()
+
+    def take(self, size: int) -> List[Path]:
+        """Remove and return the files of this size, in the order added."""
+        if self._db is not None:
+            if size not in self:
+                return []
+            rows = self._db.execute("SELECT dir, name FROM f WHERE size = ? ORDER BY rowid", (size,)).fetchall()
+            self._db.execute("DELETE FROM f WHERE size = ?", (size,))
+            self._count -= len(rows)
+            return [Path(os.path.join(self._dirs[d], name)) for d, name in rows]
+        recs = self._by_size.pop(size, None)
+        if recs is None:
+            return []
+        if isinstance(recs, int):
+            recs = [recs]
+        out = []
+        for r in recs:
+            out.append(Path(os.path.join(self._dirs[self._rec_dir[r]], self._rec_name[r])))
+            self._rec_name[r] = None
+        self._count -= len(recs)
+        return out
+
+    def close(self) -> None:
+        if self._db is None:
+            return
+        self._db.close()
+        self._db = None
+        try:
+            os.remove(self.spill_path)
+        except OSError:
+            pass
+
+    def _records(self) -> Iterator[Tuple[int, int, str]]:
+        by_rec: Dict[int, int] = {}
+        for size, recs in self._by_size.items():
+            for r in ([recs] if isinstance(recs, int) else recs):
+                by_rec[r] = size
+        for r in sorted(by_rec):
+            yield by_rec[r], self._rec_dir[r], self._rec_name[r]
+
+    def _spill(self) -> None:
+        fd, name = tempfile.mkstemp(prefix="dedupe-", suffix=".sqlite",
+                                    dir=str(self.spill_dir) if self.spill_dir else None)
+        os.close(fd)
+        self.spill_path = Path(name)
+        db = sqlite3.connect(name)
+        db.execute("PRAGMA journal_mode = OFF")
+        db.execute("PRAGMA synchronous = OFF")
+        db.execute("CREATE TABLE f (size INTEGER NOT NULL, dir INTEGER NOT NULL, name TEXT NOT NULL)")
+        self._bits = bytearray(self._BITS >> 3)
+        self._db = db
+        for row in self._records():
+            self._spill_row(*row)
+        self._flush()
+        db.execute("CREATE INDEX f_size ON f (size)")
+        self._by_size = {}
+        self._rec_dir = array("L")
+        self._rec_name = []
+
+    def _spill_row(self, size: int, dir_id: int, name: str) -> None:
+        h = (size * 2654435761) % self._BITS
+        self._bits[h >> 3] |= 1 << (h & 7)
+        self._buf.append((size, dir_id, name))
+        if len(self._buf) >= SPILL_BATCH:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._buf:
+            self._db.executemany("INSERT INTO f VALUES (?, ?, ?)", self._buf)
+            self._buf = []
+
+
+class DedupeIndex:
+    """
+    Tiered content index: size -> head/tail hash -> full digest (`algo`).
+
+    Nothing is read from disk until two files share a size; full hashes
+    are only computed when the partial hashes also match.
+
+    With workers > 1, hashing is fanned out over a thread pool (hashlib
+    releases the GIL). Digests are always applied on the calling thread in
+    input order, so lookups give the same answers as a serial run.
+
+    Files added with add_path() stay in a packed size-only tier (see
+    _ColdFiles, which spills to disk past `spill_at` files) until a
+    lookup hits their size.
+
+    Files under `mmap_root` (the dst being indexed) are hashed through
+    mmap when big; anything else, e.g. sources, with plain reads.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[HashCache] = None,
+        workers: int = 1,
+        algo: str = DEFAULT_HASH,
+        spill_at: int = 0,
+        spill_dir: Optional[Path] = None,
+        mmap_root: Optional[Path] = None,
+    ) -> None:
+        self.cache = cache
+        self.algo = algo
+        self._mmap_prefix = os.path.join(os.path.abspath(str(mmap_root)), "") if mmap_root is not None else None
+        self._cold = _ColdFiles(spill_at, spill_dir)
+        self._by_size: Dict[int, _SizeGroup] = {}
+        self._probed: Set[int] = set()
+        self._count = 0
+        self._pool: Optional[ThreadPoolExecutor] = None
+        if workers > 1:
+            self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hash")
+        self.stats = {"probes": 0, "size_unique": 0, "partial_hashes": 0, "full_hashes": 0, "bytes_hashed": 0}
+
+    def __len__(self) -> int:
+        return self._count + len(self._cold)
+
+    @property
+    def spill_path(self) -> Optional[Path]:
+        return self._cold.spill_path
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        self._cold.close()
+
+    def add_path(self, p: Path, size: int) -> None:
+        """Index a file by size only; same as add(IndexEntry(p, size)), packed."""
+        self._cold.add(p, size)
+
+    def add(self, entry: IndexEntry) -> None:
+        grp = self._by_size.get(entry.size)
+        if grp is None:
+            grp = self._by_size[entry.size] = _SizeGroup()
+        if entry._partial is not None:
+            grp.by_partial.setdefault(entry._partial, []).append(entry)
+        else:
+            grp.pending.append(entry)
+        self._count += 1
+
+    def remove(self, entry: IndexEntry) -> None:
+        grp = self._by_size.get(entry.size)
+        if grp is None:
+            return
+        bucket = grp.pending if entry._partial is None else grp.by_partial.get(entry._partial, [])
+        for i, e in enumerate(bucket):
+            if e is entry:
+                del bucket[i]
+                self._count -= 1
+                return
+
+    def collides(self, size: int) -> bool:
+        """True if a lookup for this size would have to read content."""
+        return size in self._by_size or size in self._cold
+
+    def prefetch(self, entry: IndexEntry) -> None:
+        """
+        Start hashing a soon-to-be-probed file in the background, but only
+        if its size already collides with something (otherwise find() will
+        never need its content).
+        """
+        if self._pool is None or entry._partial is not None or entry.fut is not None:
+            return
+        collides = entry.size in self._probed or self.collides(entry.size)
+        self._probed.add(entry.size)
+        if not collides or self._from_cache(entry, _partial_kind(entry)):
+            return
+        entry.fut = self._pool.submit(partial_digest, entry.path, entry.size, self.algo)
+
+    def find(self, entry: IndexEntry) -> Optional[IndexEntry]:
+        """
+        Return the first indexed entry with the same content, or None.
+        """
+        self.stats["probes"] += 1
+        grp = self._by_size.get(entry.size)
+        if entry.size in self._cold:
+            # first lookup at this size: bring its size-only files in ahead
+            # of anything added since (they were indexed first)
+            cold = [IndexEntry(p, entry.size) for p in self._cold.take(entry.size)]
+            if grp is None:
+                grp = self._by_size[entry.size] = _SizeGroup()
+            grp.pending[:0] = cold
+            self._count += len(cold)
+        if grp is None:
+            self.stats["size_unique"] += 1
+            return None
+
+        if grp.pending:
+            # unreadable dst files simply drop out of the index
+            for e, err in zip(grp.pending, self._fill(grp.pending, "partial")):
+                if err is None:
+                    grp.by_partial.setdefault(e._partial, []).append(e)
+                else:
+                    self._count -= 1
+            grp.pending = []
+
+        self._raise(self._fill([entry], "partial"))
+        cands = grp.by_partial.get(entry._partial)
+        if not cands:
+            return None
+
+        errs = self._fill([entry] + cands, "full")
+        self._raise(errs[:1])
+        for c, err in zip(cands, errs[1:]):
+            if err is None and c._digest == entry._digest:
+                return c
+        return None
+
+    @staticmethod
+    def _raise(errs: List[Optional[BaseException]]) -> None:
+        for err in errs:
+            if err is not None:
+                raise err
+
+    def _stat(self, e: IndexEntry) -> stat_result:
+        if e.st is None:
+            e.st = e.path.stat()
+        return e.st
+
+    def _from_cache(self, e: IndexEntry, kind: str) -> bool:
+        if self.cache is None:
+            return False
+        digest = self.cache.get(e.path, self._stat(e), kind)
+        if digest is None:
+            return False
+        self._apply(e, kind, digest, fresh=False)
+        return True
+
+    def _apply(self, e: IndexEntry, kind: str, digest: str, fresh: bool) -> None:
+        if kind == "partial":
+            e.partial = digest
+        else:
+            e.digest = digest
+            if e.size <= 2 * PARTIAL_BLOCK:
+                e._partial = e._digest
+        if fresh:
+            self.stats["partial_hashes" if kind == "partial" else "full_hashes"] += 1
+            self.stats["bytes_hashed"] += e.size if kind == "full" else 2 * PARTIAL_BLOCK
+            if self.cache is not None:
+                self.cache.put(e.path, self._stat(e), digest, kind)
+
+    def _fill(self, entries: List[IndexEntry], what: str) -> List[Optional[BaseException]]:
+        """
+        Make sure every entry has its partial (what="partial") or full digest.
+        Returns one error slot per entry, in order.
+        """
+        jobs: List[Tuple[IndexEntry, str, Optional[Future]]] = []
+        for e in entries:
+            kind = _partial_kind(e) if what == "partial" else "full"
+            if (e._partial if what == "partial" else e._digest) is not None:
+                jobs.append((e, kind, None))
+                continue
+            fut = e.fut if what == "partial" else None
+            try:
+                if fut is None and self._from_cache(e, kind):
+                    jobs.append((e, kind, None))
+                    continue
+            except OSError as ex:
+                jobs.append((e, kind, _Failed(ex)))
+                continue
+            if fut is None and self._pool is not None and len(entries) > 1:
+                fut = self._pool.submit(self._digest_fn(e, kind), e.path, e.size, self.algo)
+            jobs.append((e, kind, fut))
+
+        errs: List[Optional[BaseException]] = []
+        for e, kind, fut in jobs:
+            e.fut = None
+            if (e._partial if what == "partial" else e._digest) is not None:
+                errs.append(None)
+                continue
+            try:
+                digest = fut.result() if fut is not None else self._digest_fn(e, kind)(e.path, e.size, self.algo)
+                self._apply(e, kind, digest, fresh=True)
+                errs.append(None)
+            except Exception as ex:
+                errs.append(ex)
+        return errs
+
+    def _digest_fn(self, e: IndexEntry, kind: str) -> Callable[[Path, int, str], str]:
+        # mmap only for files under the indexed dst, never for sources
+        prefix = self._mmap_prefix
+        if kind == "full" and prefix is not None and os.path.abspath(str(e.path)).startswith(prefix):
+            return _full_digest_mmap
+        return _digest_fn(kind)
+
+
+class _Failed:
+    """Stand-in future for a job that failed before it was submitted."""
+
+    def __init__(self, err: BaseException) -> None:
+        self.err = err
+
+    def result(self) -> str:
+        raise self.err
+
+
+def _partial_kind(e: IndexEntry) -> str:
+    # small files are hashed whole, so their partial digest is the full one
+    return "full" if e.size <= 2 * PARTIAL_BLOCK else "partial"
+
+
+def _full_digest(p: Path, size: int, algo: str) -> str:
+    return hash_file(p, algo, size)
+
+
+def _full_digest_mmap(p: Path, size: int, algo: str) -> str:
+    return hash_file(p, algo, size, use_mmap=True)
+
+
+def _digest_fn(kind: str) -> Callable[[Path, int, str], str]:
+    return partial_digest if kind == "partial" else _full_digest
+
+
+# -----------------------
+# throughput probe (--hash-probe)
+# -----------------------
+
+def _hash_read(p: Path, algo: str) -> str:
+    # the pre-readinto path: a fresh bytes object per chunk
+    h = hashlib.new(algo)
+    with p.open("rb") as f:
+        while True:
+            b = f.read(CHUNK)
+            if not b:
+                break
+            h.update(b)
+    return h.hexdigest()
+
+
+def _hash_readinto(p: Path, algo: str) -> str:
+    h = hashlib.new(algo)
+    with p.open("rb") as f:
+        _update_from(h, f)
+    return h.hexdigest()
+
+
+def _hash_mmap(p: Path, algo: str) -> str:
+    h = hashlib.new(algo)
+    with p.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        h.update(mm)
+    return h.hexdigest()
+
+
+HASH_METHODS: Dict[str, Callable[[Path, str], str]] = {
+    "read": _hash_read,
+    "readinto": _hash_readinto,
+    "mmap": _hash_mmap,
+}
+
+
+def probe_hash_speed(
+    sample: Path,
+    algos: Tuple[str, ...] = HASH_ALGOS,
+    rounds: int = 3,
+) -> List[Dict[str, Any]]:
+    """
+    MB/s of every algo x read method on `sample` (best of `rounds`, after
+    one warm-up read, so mostly page-cache speed), fastest first.
+    """
+    size = sample.stat().st_size
+    _hash_read(sample, DEFAULT_HASH)
+    out: List[Dict[str, Any]] = []
+    for algo in algos:
+        for method, fn in HASH_METHODS.items():
+            best = float("inf")
+            for _ in range(rounds):
+                t0 = time.perf_counter()
+                fn(sample, algo)
+                best = min(best, time.perf_counter() - t0)
+            out.append({
+                "algo": algo,
+                "method": method,
+                "mb_per_s": round(size / best / 1e6, 1) if best > 0 else None,
+            })
+    out.sort(key=lambda r: -(r["mb_per_s"] or 0))
+    return out
@@ -0,0 +1,99 @@
+from __future__ import annotations
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, Hashable, Iterable, List, Optional, Tuple
+
+DoneFn = Callable[[Any, Optional[BaseException]], None]
+
+
+class OpExecutor:
+    """
+    Bounded worker pool for file operations.
+
+    - submit() runs `fn` on a worker; `on_done(result, error)` is always
+      called on the submitting thread, in submission order, so plan lines
+      and counters have a single writer.
+    - Ops sharing a key (e.g. the destination path) run one after another.
+    - At most `window` ops are in flight; submit() blocks beyond that.
+
+    With workers <= 1 everything runs inline, which is exactly the old
+    serial behaviour.
+    """
+
+    def __init__(self, workers: int = 1, window: int = 0) -> None:
+        self._pool: Optional[ThreadPoolExecutor] = None
+        if workers > 1:
+            self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="op")
+        self.window = window or max(1, workers) * 4
+        self._queue: Deque[Tuple[Optional[Future], Tuple[Hashable, ...], DoneFn]] = deque()
+        self._last: Dict[Hashable, Future] = {}
+
+    @property
+    def pending(self) -> int:
+        return len(self._queue)
+
+    def busy(self, key: Hashable) -> bool:
+        """True while an op holding `key` has not been reported yet."""
+        return key in self._last
+
+    def submit(self, fn: Callable[[], Any], on_done: DoneFn, keys: Iterable[Hashable] = ()) -> None:
+        if self._pool is None:
+            try:
+                res, err = fn(), None
+            except Exception as e:
+                res, err = None, e
+            on_done(res, err)
+            return
+
+        keys = tuple(keys)
+        deps = [self._last[k] for k in keys if k in self._last]
+        fut = self._pool.submit(_run_after, deps, fn)
+        for k in keys:
+            self._last[k] = fut
+        self._queue.append((fut, keys, on_done))
+        while len(self._queue) > self.window:
+            self._pop()
+
+    def defer(self, fn: Callable[..., Any], *args: Any) -> None:
+        """
+        Run fn(*args) on this thread once every op submitted so far has
+        been reported (immediately if nothing is in flight).
+        """
+        if not self._queue:
+            fn(*args)
+            return
+        self._queue.append((None, (), lambda _res, _err: fn(*args)))
+
+    def drain(self) -> None:
+        while self._queue:
+            self._pop()
+
+    def shutdown(self) -> None:
+        try:
+            self.drain()
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
+
+    def _pop(self) -> None:
+        fut, keys, on_done = self._queue.popleft()
+        res: Any = None
+        err: Optional[BaseException] = None
+        if fut is not None:
+            try:
+                res = fut.result()
+            except Exception as e:
+                err = e
+            for k in keys:
+                if self._last.get(k) is fut:
+                    del self._last[k]
+        on_done(res, err)
+
+
+def _run_after(deps: List[Future], fn: Callable[[], Any]) -> Any:
+    # deps were queued before us, so they are already running or done:
+    # waiting here cannot deadlock the pool.
+    if deps:
+        wait(deps)
+    return fn()
@@ -0,0 +1,88 @@
+from __future__ import annotations
+import fnmatch
+import os
+import re
+from os import stat_result
+from pathlib import Path
+from typing import Iterable, Optional, Pattern
+
+from config import RunConfig
+
+
+def _compile(patterns: Iterable[str]) -> Optional[Pattern[str]]:
+    """
+    Fold glob and "re:" patterns into one regex matched against the
+    '/'-separated path relative to src. A glob without '/' also matches
+    the bare file/dir name at any depth (like .gitignore).
+    """
+    parts = []
+    for pat in patterns:
+        if pat.startswith("re:"):
+            parts.append(f"(?:{pat[3:]})")
+            continue
+        rx = fnmatch.translate(pat)  # '(?s:...)\\Z'
+        if "/" not in pat:
+            rx = f"(?:.*/)?{rx}"
+        parts.append(f"(?:{rx})")
+    if not parts:
+        return None
+    return re.compile("|".join(parts), 0 if os.name != "nt" else re.IGNORECASE)
+
+
+class FileFilter:
+    """
+    Compiled include/exclude rules for run_sort.
+
+    Checks are split by what they need, so callers can run the cheap ones
+    first: prune_dir() and by_name() look only at the path (no syscalls);
+    by_stat() needs the stat result. Each returns a SKIP reason or None.
+    """
+
+    def __init__(self, cfg: RunConfig) -> None:
+        self._root = str(cfg.src)
+        self.only_ext = cfg.only_ext
+        self.exclude_ext = cfg.exclude_ext
+        self._include = _compile(cfg.include)
+        self._exclude = _compile(cfg.exclude)
+        self._exclude_dir = _compile(cfg.exclude_dir)
+        self.min_size = cfg.min_size_kb * 1024
+        self.max_size = cfg.max_size_kb * 1024
+        self.mtime_after = cfg.mtime_after
+        self.mtime_before = cfg.mtime_before
+
+    def _rel(self, path: str) -> str:
+        rel = path[len(self._root):].lstrip("\\/") if path.startswith(self._root) else path
+        return rel.replace(os.sep, "/") if os.sep != "/" else rel
+
+    def prune_dir(self, path: str) -> bool:
+        """True if the scan should not descend into this directory."""
+        return self._exclude_dir is not None and self._exclude_dir.match(self._rel(path)) is not None
+
+    def by_name(self, path: Path) -> Optional[str]:
+        ext = path.suffix.lower().lstrip(".") or "no_ext"
+        if self.only_ext and ext not in self.only_ext:
+            return "not_in_only_ext"
+        if self.exclude_ext and ext in self.exclude_ext:
+            return "in_exclude_ext"
+        if self._include is not None or self._exclude is not None:
+            rel = self._rel(str(path))
+            if self._include is not None and self._include.match(rel) is None:
+                return "not_included"
+            if self._exclude is not None and self._exclude.match(rel) is not None:
+                return "excluded"
+        return None
+
+    def by_stat(self, st: stat_result) -> Optional[str]:
+        if self.min_size > 0 and st.st_size < self.min_size:
+            return "size_too_small"
+        if self.max_size > 0 and st.st_size > self.max_size:
+            return "size_too_large"
+        if self.mtime_after is not None and st.st_mtime < self.mtime_after:
+            return "mtime_too_old"
+        if self.mtime_before is not None and st.st_mtime >= self.mtime_before:
+            return "mtime_too_new"
+        return None
+
+    @property
+    def prunes(self) -> bool:
+        return self._exclude_dir is not None
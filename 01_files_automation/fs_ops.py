@@ -1,12 +1,119 @@
 from __future__ import annotations
+import errno
+import os
 import shutil
+import threading
 from pathlib import Path
-from typing import Tuple
+from typing import BinaryIO, Dict, Optional, Set, Tuple
 
-def ensure_dir(p: Path) -> None:
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+FICLONE = 0x40049409  # linux/fs.h: _IOW(0x94, 9, int)
+_COPY_CHUNK = 8 * 1024 * 1024
+
+# errors that mean "this primitive doesn't work here", not "the copy failed"
+_UNSUPPORTED = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.ENOTTY, errno.EBADF,
+                errno.EPERM, getattr(errno, "EOPNOTSUPP", errno.ENOTSUP), errno.ENOTSUP}
+
+def ensure_dir(p: Path, dirs: Optional["DirCache"] = None) -> None:
+    if dirs is not None:
+        dirs.ensure(p)
+        return
     p.mkdir(parents=True, exist_ok=True)
 
-def next_available(p:Path) -> Path:
+
+class DirCache:
+    """
+    Run-scoped set of directories known to exist.
+
+    The first ensure() of a directory does the mkdir; later ones for it (or
+    for any of its parents) cost a set lookup. Safe to share with
+    OpExecutor workers. Like NameRegistry, it does not notice directories
+    removed behind the run's back; forget() them after a failed op.
+    """
+
+    def __init__(self) -> None:
+        self._known: Set[str] = set()
+        self._lock = threading.Lock()
+        self.created = 0
+
+    def ensure(self, p: Path) -> None:
+        key = str(p)
+        if key in self._known:
+            return
+        p.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            self.created += 1
+            # mkdir(parents=True) proved every ancestor exists too
+            for d in (p, *p.parents):
+                k = str(d)
+                if k in self._known:
+                    break
+                self._known.add(k)
+
+    def forget(self, p: Path) -> None:
+        with self._lock:
+            self._known.discard(str(p))
+
+class NameRegistry:
+    """
+    Run-scoped set of taken names per target directory.
+
+    Each directory is listed once with os.scandir, then kept current by
+    reserve()/release() as the run hands out names, so conflict checks cost
+    no syscalls and `stem_N` probing resumes where it last stopped. A dry
+    run reserves exactly like a real run, so both pick the same names.
+    Changes made behind the run's back are not seen until invalidate().
+    """
+
+    def __init__(self) -> None:
+        self._dirs: Dict[str, Set[str]] = {}
+        self._next: Dict[Tuple[str, str, str], int] = {}
+
+    def _names(self, d: Path) -> Set[str]:
+        key = str(d)
+        names = self._dirs.get(key)
+        if names is None:
+            names = set()
+            try:
+                with os.scandir(key) as it:
+                    for de in it:
+                        names.add(os.path.normcase(de.name))
+            except (FileNotFoundError, NotADirectoryError):
+                pass
+            self._dirs[key] = names
+        return names
+
+    def exists(self, p: Path) -> bool:
+        return os.path.normcase(p.name) in self._names(p.parent)
+
+    def reserve(self, p: Path) -> None:
+        self._names(p.parent).add(os.path.normcase(p.name))
+
+    def release(self, p: Path) -> None:
+        self._names(p.parent).discard(os.path.normcase(p.name))
+
+    def invalidate(self, d: Path) -> None:
+        self._dirs.pop(str(d), None)
+
+    def next_available(self, p: Path) -> Path:
+        if not self.exists(p):
+            return p
+        stem, suf, parent = p.stem, p.suffix, p.parent
+        names = self._names(parent)
+        key = (str(parent), stem, suf)
+        i = self._next.get(key, 1)
+        while os.path.normcase(f"{stem}_{i}{suf}") in names:
+            i += 1
+        self._next[key] = i + 1
+        return parent / f"{stem}_{i}{suf}"
+
+def next_available(p:Path, names: Optional[NameRegistry] = None) -> Path:
+    if names is not None:
+        return names.next_available(p)
     if not p.exists():
         return p
     stem = p.stem
@@ -20,11 +127,16 @@ def next_available(p:Path) -> Path:
             return cand
         i += 1
 
-def resolve_dst(dst: Path, on_conflict: str) -> Tuple[Path, str]:
-    if not dst.exists():
+def resolve_dst(dst: Path, on_conflict: str, names: Optional[NameRegistry] = None) -> Tuple[Path, str]:
+    """
+    Decide where `dst` really goes. With a NameRegistry the caller must
+    reserve() the returned path once it commits to writing there.
+    """
+    taken = names.exists(dst) if names is not None else dst.exists()
+    if not taken:
         return dst, "none"
     if on_conflict == "rename":
-        return next_available(dst), "rename"
+        return next_available(dst, names), "rename"
     if on_conflict == "skip":
         return dst, "skip"
     if on_conflict == "overwrite":
@@ -44,8 +156,120 @@ def remove_if_exists(p: Path) -> None:
     except IsADirectoryError:
         raise
 
-def do_copy(src: Path, dst: Path) -> None:
-    shutil.copy2(str(src), str(dst))
+def _reflink(fsrc: BinaryIO, fdst: BinaryIO) -> bool:
+    if fcntl is None:
+        return False
+    try:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return True
+    except OSError as e:
+        if e.errno in _UNSUPPORTED:
+            return False
+        raise
+
+def _kernel_copy(fsrc: BinaryIO, fdst: BinaryIO, size: int, use_cfr: bool) -> bool:
+    """
+    copy_file_range / sendfile loop. Returns False if the primitive is not
+    usable here and nothing has been written yet; that includes a first
+    call copying 0 bytes of a non-empty file, which some filesystems (FUSE,
+    overlayfs, ...) do instead of failing. Raises OSError if the copy
+    stops short of `size`.
+    """
+    infd, outfd = fsrc.fileno(), fdst.fileno()
+    offset = 0
+    while offset < size:
+        try:
+            if use_cfr:
+                n = os.copy_file_range(infd, outfd, min(_COPY_CHUNK, size - offset))
+            else:
+                n = os.sendfile(outfd, infd, offset, min(_COPY_CHUNK, size - offset))
+        except OSError as e:
+            if offset == 0 and e.errno in _UNSUPPORTED:
+                return False
+            raise
+        if n == 0:
+            if offset == 0:
+                return False
+            # src shrank under us, or the primitive gave up midway
+            raise OSError(errno.EIO, f"short copy: {offset} of {size} bytes")
+        offset += n
+    return True
+
+def _copy_data(fsrc: BinaryIO, fdst: BinaryIO) -> str:
+    size = os.fstat(fsrc.fileno()).st_size
+    if _reflink(fsrc, fdst):
+        return "reflink"
+    if hasattr(os, "copy_file_range") and _kernel_copy(fsrc, fdst, size, True):
+        return "copy_file_range"
+    if hasattr(os, "sendfile") and os.name == "posix" and _kernel_copy(fsrc, fdst, size, False):
+        return "sendfile"
+    shutil.copyfileobj(fsrc, fdst, _COPY_CHUNK)
+    return "buffered"
+
+def do_copy(src: Path, dst: Path) -> str:
+    """
+    Copy data + metadata (like shutil.copy2) with the cheapest primitive that
+    works: reflink (FICLONE) -> copy_file_range -> sendfile -> buffered.
+    Returns the method used.
+    """
+    with open(src, "rb") as fsrc:
+        try:
+            with open(dst, "wb") as fdst:
+                method = _copy_data(fsrc, fdst)
+        except BaseException:
+            # never leave a truncated copy behind (do_move keeps src)
+            remove_if_exists(dst)
+            raise
+    shutil.copystat(str(src), str(dst))
+    return method
+
+def _same_device(a: Path, b: Path) -> bool:
+    try:
+        return os.stat(a).st_dev == os.stat(b).st_dev
+    except OSError:
+        return False
+
+def do_move(src: Path, dst: Path) -> str:
+    """
+    rename() when src and dst share a filesystem, otherwise do_copy + unlink.
+    Returns the method used ("rename" or the copy method).
+    """
+    try:
+        os.rename(src, dst)
+        return "rename"
+    except OSError as e:
+        if e.errno != errno.EXDEV and _same_device(src, dst.parent):
+            raise
+    method = do_copy(src, dst)
+    os.unlink(src)
+    return method
 
-def do_move(src: Path, dst: Path) -> None:
-    shutil.move(str(src), str(dst))
+def do_link(src: Path, dst: Path, how: str = "link") -> str:
+    """
+    Make `dst` another name for `src`'s content without copying data: a
+    hard link (how="link") or a reflink clone (how="reflink"). Where the
+    filesystem can't (cross-device, no FICLONE, link limit, ...) this falls
+    back to do_copy. Returns the method used.
+    """
+    if how == "link":
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED and e.errno != errno.EMLINK:
+                raise
+    else:
+        with open(src, "rb") as fsrc:
+            try:
+                with open(dst, "wb") as fdst:
+                    cloned = _reflink(fsrc, fdst)
+                if cloned:
+                    shutil.copystat(str(src), str(dst))
+            except BaseException:
+                # the op will be recorded as FAIL, which undo skips: don't
+                # leave an empty or half-made bucket file behind
+                remove_if_exists(dst)
+                raise
+        if cloned:
+            return "reflink"
+    return do_copy(src, dst)
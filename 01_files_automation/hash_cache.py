@@ -0,0 +1,148 @@
+from __future__ import annotations
+import json
+import os
+from os import stat_result
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+CACHE_VERSION = 1
+
+_SLOT = {"full": 3, "partial": 4}
+
+
+def _key(p: Path) -> str:
+    return os.path.abspath(str(p))
+
+
+def _stamp(st: stat_result) -> List[int]:
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+
+def _same(ent: List, st: stat_result) -> bool:
+    # st_ino is 0 when it is unknown (os.DirEntry.stat() on Windows): then
+    # only size and mtime_ns can be compared
+    if ent[0] != st.st_size or ent[1] != st.st_mtime_ns:
+        return False
+    return not st.st_ino or not ent[2] or ent[2] == st.st_ino
+
+
+class HashCache:
+    """
+    Persistent signature cache for --dedupe.
+
+    Entries are keyed by absolute path and validated by (size, mtime_ns, inode),
+    so an unchanged file is never hashed twice across runs. An inode of 0
+    (unknown) on either side matches any inode. Stored as a single
+    JSON document, rewritten atomically on save(). Digests are only valid for
+    the hash algorithm they were made with; loading a cache written with a
+    different one starts cold.
+    """
+
+    def __init__(self, path: Optional[Path], algo: str = "sha256") -> None:
+        self.path = path
+        self.algo = algo
+        self._entries: Dict[str, List] = {}  # key -> [size, mtime_ns, ino, full, partial]
+        self._confirmed: Set[str] = set()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, path: Optional[Path], algo: str = "sha256") -> "HashCache":
+        cache = cls(path, algo)
+        if path is None or not path.exists():
+            return cache
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                doc = json.load(f)
+            if doc.get("version") == CACHE_VERSION and doc.get("algo", "sha256") == algo:
+                cache._entries = dict(doc.get("entries", {}))
+            else:
+                cache._dirty = True
+        except (OSError, ValueError):
+            # unreadable/corrupt cache is just a cold cache
+            cache._entries = {}
+            cache._dirty = True
+        return cache
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, p: Path, st: stat_result, kind: str = "full") -> Optional[str]:
+        key = _key(p)
+        ent = self._entries.get(key)
+        slot = _SLOT[kind]
+        if ent is not None and _same(ent, st) and len(ent) > slot and ent[slot]:
+            self._confirmed.add(key)
+            self.hits += 1
+            return ent[slot]
+        self.misses += 1
+        return None
+
+    def put(self, p: Path, st: stat_result, digest: str, kind: str = "full") -> None:
+        key = _key(p)
+        stamp = _stamp(st)
+        ent = self._entries.get(key)
+        if ent is None or not _same(ent, st):
+            ent = stamp + [None, None]
+        else:
+            if len(ent) < 5:
+                ent = ent + [None] * (5 - len(ent))
+            if st.st_ino:
+                ent[2] = st.st_ino
+        ent[_SLOT[kind]] = digest
+        self._entries[key] = ent
+        self._confirmed.add(key)
+        self._dirty = True
+
+    def touch(self, p: Path, st: stat_result) -> None:
+        """
+        Mark an entry as still valid (or drop it if the file changed).
+        """
+        key = _key(p)
+        ent = self._entries.get(key)
+        if ent is None:
+            return
+        if _same(ent, st):
+            self._confirmed.add(key)
+        else:
+            del self._entries[key]
+            self._dirty = True
+
+    def discard(self, p: Path) -> None:
+        key = _key(p)
+        if self._entries.pop(key, None) is not None:
+            self._dirty = True
+        self._confirmed.discard(key)
+
+    def evict_stale(self) -> int:
+        """
+        Drop entries not confirmed during this run whose file is gone or changed.
+        """
+        evicted = 0
+        for key in list(self._entries):
+            if key in self._confirmed:
+                continue
+            try:
+                st = os.stat(key)
+            except OSError:
+                st = None
+            if st is None or not _same(self._entries[key], st):
+                del self._entries[key]
+                evicted += 1
+        if evicted:
+            self._dirty = True
+        return evicted
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        self.evict_stale()
+        if not self._dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION, "algo": self.algo, "entries": self._entries}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+        self._dirty = False
@@ -1,38 +1,145 @@
+import atexit
 import logging
+import queue
 import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
+
+_queues: Dict[str, Tuple[QueueListener, "_BoundedQueueHandler"]] = {}
+
+
+class _BoundedQueueHandler(QueueHandler):
+    """
+    QueueHandler over a bounded queue. When the queue is full, "block"
+    waits for the listener thread; "drop" discards records below WARNING
+    (counting them) so the caller never waits on log I/O.
+    """
+
+    def __init__(self, q: "queue.Queue[logging.LogRecord]", policy: str = "block") -> None:
+        super().__init__(q)
+        self.policy = policy
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.policy == "drop" and record.levelno < logging.WARNING:
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                self.dropped += 1
+            return
+        self.queue.put(record)
+
 
 def setup_logging(
     log_file_path: Optional[Path],
     console_level: int = logging.INFO,
     file_level: int = logging.DEBUG,
     logger_name: str = "filesorter",
+    queue_size: int = 0,
+    queue_policy: str = "block",
 ) -> logging.Logger:
-    
+    """
+    With queue_size > 0, records go through a bounded queue to a
+    QueueListener thread that owns the console/file handlers, so the
+    caller only pays for building the record; see _BoundedQueueHandler
+    for queue_policy. The listener is stopped (and drained) at exit or by
+    stop_logging().
+    """
+    stop_logging(logger_name)
     logger = logging.getLogger(logger_name)
     logger.setLevel(logging.DEBUG)
 
     if logger.handlers:
         logger.handlers.clear()
     logger.propagate = False
-    
+
     file_fmt = logging.Formatter(
         fmt="%(asctime)s - [%(levelname)s] - %(filename)s:%(lineno)d - %(message)s",
         datefmt="%Y-%m-%d %H:%M:%S",
     )
     console_fmt = logging.Formatter(fmt="%(asctime)s - [%(levelname)s] - %(message)s")
 
+    handlers: List[logging.Handler] = []
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(console_level)
     console_handler.setFormatter(console_fmt)
-    logger.addHandler(console_handler)
+    handlers.append(console_handler)
 
     if log_file_path is not None:
         log_file_path.parent.mkdir(parents=True, exist_ok=True)
         file_handler = logging.FileHandler(log_file_path, encoding="utf-8")
         file_handler.setLevel(file_level)
         file_handler.setFormatter(file_fmt)
-        logger.addHandler(file_handler)
+        handlers.append(file_handler)
+
+    if queue_size <= 0:
+        for h in handlers:
+            logger.addHandler(h)
+        return logger
+
+    q: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=queue_size)
+    qh = _BoundedQueueHandler(q, queue_policy)
+    # records no handler wants never enter the queue
+    qh.setLevel(min(h.level for h in handlers))
+    listener = QueueListener(q, *handlers, respect_handler_level=True)
+    listener.start()
+    _queues[logger_name] = (listener, qh)
+    atexit.register(stop_logging, logger_name)
+    logger.addHandler(qh)
+    return logger
+
+
+def stop_logging(logger_name: str = "filesorter") -> None:
+    """Drain and stop the queue listener started by setup_logging, if any."""
+    listener, qh = _queues.pop(logger_name, (None, None))
+    if listener is None:
+        return
+    logging.getLogger(logger_name).removeHandler(qh)
+    listener.stop()
+    if qh.dropped:
+        rec = logging.LogRecord(logger_name, logging.WARNING, __file__, 0,
+                                "log queue full: dropped %d record(s)", (qh.dropped,), None)
+        for h in listener.handlers:
+            if rec.levelno >= h.level:
+                h.handle(rec)
+    for h in listener.handlers:
+        h.close()
+
+
+class ProgressLog:
+    """
+    Rate-limited progress: at most one INFO line per `every_s` seconds
+    (never if <= 0) with files/s and MB/s since the start. tick() costs a
+    counter bump and one monotonic clock read.
+    """
+
+    def __init__(self, logger: logging.Logger, label: str, every_s: float = 5.0) -> None:
+        self.logger = logger
+        self.label = label
+        self.every_s = every_s
+        self.files = 0
+        self.bytes = 0
+        self._t0 = time.monotonic()
+        self._next = self._t0 + every_s
+
+    def tick(self, files: int = 1, nbytes: int = 0) -> None:
+        self.files += files
+        self.bytes += nbytes
+        if self.every_s <= 0:
+            return
+        now = time.monotonic()
+        if now >= self._next:
+            self._next = now + self.every_s
+            self._log(now)
+
+    def add_bytes(self, nbytes: int) -> None:
+        self.bytes += nbytes
 
-    return logger
\ No newline at end of file
+    def _log(self, now: float) -> None:
+        secs = max(now - self._t0, 1e-9)
+        self.logger.info(
+            "%s: %d files (%.0f/s), %.1f MB (%.1f MB/s)",
+            self.label, self.files, self.files / secs, self.bytes / 1e6, self.bytes / secs / 1e6,
+        )
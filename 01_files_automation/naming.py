@@ -1,7 +1,43 @@
 from __future__ import annotations
+from bisect import bisect_right
 from pathlib import Path
 from datetime import datetime
 from os import stat_result
+from typing import List, Tuple
+
+from capture_time import capture_timestamp
+
+
+class MonthBuckets:
+    """
+    "YYYY-MM" (local time) for a timestamp, cached per month range.
+
+    Each month seen once is kept as [start, end) in epoch seconds, so the
+    next file from the same month is a bisect instead of a datetime call.
+    """
+
+    def __init__(self) -> None:
+        self._starts: List[float] = []
+        self._ranges: List[Tuple[float, float, str]] = []
+
+    def __call__(self, ts: float) -> str:
+        i = bisect_right(self._starts, ts) - 1
+        if i >= 0:
+            start, end, label = self._ranges[i]
+            if ts < end:
+                return label
+        dt = datetime.fromtimestamp(ts)
+        start = datetime(dt.year, dt.month, 1).timestamp()
+        end = datetime(dt.year + dt.month // 12, dt.month % 12 + 1, 1).timestamp()
+        label = f"{dt.year:04d}-{dt.month:02d}"
+        i = bisect_right(self._starts, start)
+        self._starts.insert(i, start)
+        self._ranges.insert(i, (start, end, label))
+        return label
+
+
+month_bucket = MonthBuckets()
+
 
 def bucket_for(file: Path, st: stat_result, mode: str) -> str:
     if mode == "ext":
@@ -11,6 +47,9 @@ def bucket_for(file: Path, st: stat_result, mode: str) -> str:
         else:
             return suf
     if mode == "date":
-        dt = datetime.fromtimestamp(st.st_mtime)
-        return dt.strftime("%Y-%m")
+        return month_bucket(st.st_mtime)
+    if mode == "capture-date":
+        # EXIF/container time if the header has one, else mtime
+        ts = capture_timestamp(file)
+        return month_bucket(st.st_mtime if ts is None else ts)
     return "others"
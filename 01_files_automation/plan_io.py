@@ -1,10 +1,13 @@
 from __future__ import annotations
 import json
 import os
-from dataclasses import dataclass
+import time
+from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, Generator, IO
+from typing import Any, Dict, Generator, IO, List, Optional, Set, Tuple
+
+RUN_MARKERS = ("RUN_START", "RUN_RESUME", "RUN_END")
 
 def now_iso() -> str:
     return datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
@@ -21,38 +24,385 @@ def _write_line(fp: IO[str], obj: Dict[str, Any], fsync: bool) -> None:
 
 @dataclass
 class PlanWriter:
+    """
+    Append-only JSONL plan writer.
+
+    Crash-safety per mode:
+    - default (batch_lines=1, fsync=False): every line is handed to the OS
+      before the next file op starts. Survives a process crash; the last
+      lines may be lost on power loss / kernel panic.
+    - fsync=True, batch_lines=1: every line is on disk before the next op.
+      Survives power loss, at the cost of one fsync per file.
+    - group commit (batch_lines > 1 and/or batch_ms > 0): lines are buffered
+      in-process and written (and fsync'ed, if fsync=True) once batch_lines
+      are pending or batch_ms have passed since the last commit. A crash can
+      lose up to one group: ops that already happened but whose lines were
+      not committed will not be seen by --undo. Groups are always committed
+      at run_start, run_end and close(), so an exception that reaches the
+      runner's finally loses nothing.
+
+    With `index_fp`, every RUN_START/RUN_RESUME/RUN_END also gets a line
+    {"run_id", "op", "offset", "end"} in the sidecar index (<plan>.idx), so
+    readers can seek straight to one run's segment.
+    """
     fp: IO[str]
     run_id: str
     fsync: bool = False
+    batch_lines: int = 1
+    batch_ms: int = 0
+    index_fp: Optional[IO[str]] = None
+    _buf: List[str] = field(default_factory=list, repr=False)
+    _last_commit: float = field(default_factory=time.monotonic, repr=False)
+    busy_s: float = field(default=0.0, repr=False)  # time spent in item(), for phase timing
+
+    @classmethod
+    def create(cls, path: Path, run_id: str, **kw: Any) -> "PlanWriter":
+        """
+        Open `path` (and its sidecar index) for appending. A last line cut
+        short by a crash is dropped first, so new lines don't get glued onto
+        it. A non-empty plan whose index is missing or does not check out
+        (e.g. written before sidecars existed, or just truncated) gets its
+        index rebuilt, so it covers the older runs too.
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists() and path.stat().st_size > 0:
+            _terminate_last_line(path)
+            if _read_index(path) is None:
+                _write_index(path, _scan_markers(path))
+        fp = open(path, "a", encoding="utf-8", newline="\n")
+        index_fp = open(index_path_for(path), "a", encoding="utf-8", newline="\n")
+        return cls(fp, run_id, index_fp=index_fp, **kw)
+
+    @property
+    def grouped(self) -> bool:
+        return self.batch_lines > 1 or self.batch_ms > 0
+
+    def _emit(self, obj: Dict[str, Any], commit: bool = False) -> None:
+        if not self.grouped:
+            _write_line(self.fp, obj, self.fsync)
+            return
+        self._buf.append(json.dumps(obj, ensure_ascii=False) + "\n")
+        if (
+            commit
+            or (self.batch_lines > 1 and len(self._buf) >= self.batch_lines)
+            or (self.batch_ms > 0 and (time.monotonic() - self._last_commit) * 1000 >= self.batch_ms)
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        """Commit buffered lines (one write + flush, plus one fsync if enabled)."""
+        if self._buf:
+            self.fp.write("".join(self._buf))
+            self._buf.clear()
+            self.fp.flush()
+            if self.fsync:
+                os.fsync(self.fp.fileno())
+        self._last_commit = time.monotonic()
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            self.fp.close()
+            if self.index_fp is not None:
+                self.index_fp.close()
+
+    def _mark(self, obj: Dict[str, Any]) -> None:
+        # run markers are always committed on their own, so their byte
+        # offsets are exact
+        self.flush()
+        start = os.fstat(self.fp.fileno()).st_size
+        _write_line(self.fp, obj, self.fsync)
+        if self.index_fp is not None:
+            end = os.fstat(self.fp.fileno()).st_size
+            _write_line(self.index_fp, {
+                "run_id": self.run_id,
+                "op": obj["op"],
+                "offset": start,
+                "end": end,
+            }, self.fsync)
 
     def run_start(self, cfg: Dict[str, Any]) -> None:
-        _write_line(self.fp, {
+        self._mark({
             "ts":now_iso(),
             "run_id": self.run_id,
             "op": "RUN_START",
             "status": "OK",
             "config": cfg,
-        }, self.fsync)
+        })
+
+    def run_resume(self, cfg: Dict[str, Any]) -> None:
+        # marks where a resumed run picks up again; same run_id as its RUN_START
+        self._mark({
+            "ts": now_iso(),
+            "run_id": self.run_id,
+            "op": "RUN_RESUME",
+            "status": "OK",
+            "config": cfg,
+        })
 
     def item(self, ev: Dict[str, Any]) -> None:
+        t0 = time.perf_counter()
         ev = dict(ev)
         ev.setdefault("ts", now_iso())
         ev.setdefault("run_id", self.run_id)
-        _write_line(self.fp, ev, self.fsync)
+        self._emit(ev)
+        self.busy_s += time.perf_counter() - t0
     
     def run_end(self, summary: Dict[str, Any]) -> None:
-        _write_line(self.fp, {
+        self._mark({
             "ts": now_iso(),
             "run_id": self.run_id,
             "op": "RUN_END",
             "status": "OK",
             "summary": summary,
-        }, self.fsync)
+        })
 
-def read_json(path: Path) -> Generator[Dict[str, Any], None, None]:
-    with open(path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
+def read_json(path: Path, start: int = 0, end: Optional[int] = None) -> Generator[Dict[str, Any], None, None]:
+    """
+    Stream JSON lines from byte offset `start` up to (not including) `end`.
+    An unparsable last line without its newline (a write cut short by a
+    crash) is ignored.
+    """
+    with open(path, "rb") as f:
+        if start:
+            f.seek(start)
+        pos = start
+        for raw in f:
+            if end is not None and pos >= end:
+                break
+            pos += len(raw)
+            line = raw.strip()
             if not line:
                 continue
-            yield json.loads(line)
\ No newline at end of file
+            if not raw.endswith(b"\n"):
+                ev = _loads_unterminated(line)
+                if ev is not None:
+                    yield ev
+                return
+            yield json.loads(line)
+
+
+def read_json_reverse(
+    path: Path,
+    start: int = 0,
+    end: Optional[int] = None,
+    block: int = 1 << 20,
+) -> Generator[Dict[str, Any], None, None]:
+    """
+    Like read_json(), but last line first. The file is read backwards in
+    `block`-sized chunks, so memory stays bounded by the block (plus the
+    longest line) no matter how big the plan is.
+    """
+    with open(path, "rb") as f:
+        pos = f.seek(0, os.SEEK_END) if end is None else end
+        tail = b""
+        last = True
+        while pos > start:
+            n = min(block, pos - start)
+            pos -= n
+            f.seek(pos)
+            lines = (f.read(n) + tail).split(b"\n")
+            # the first piece may be the end of a line that starts further back
+            tail = lines[0]
+            if last and len(lines) > 1:
+                # text after the final newline: a line cut short, if any
+                last = False
+                ev = _loads_unterminated(lines.pop().strip())
+                if ev is not None:
+                    yield ev
+            for raw in reversed(lines[1:]):
+                line = raw.strip()
+                if line:
+                    yield json.loads(line)
+        line = tail.strip()
+        if line and not last:
+            yield json.loads(line)
+        elif line:
+            ev = _loads_unterminated(line)
+            if ev is not None:
+                yield ev
+
+
+def _terminate_last_line(path: Path, block: int = 1 << 16) -> None:
+    """
+    Make `path` end with a newline: a complete JSON object after the last
+    newline gets one, anything else there is truncated away.
+    """
+    with open(path, "r+b") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+        cut = size
+        while cut > 0:
+            n = min(block, cut)
+            f.seek(cut - n)
+            i = f.read(n).rfind(b"\n")
+            if i >= 0:
+                cut = cut - n + i + 1
+                break
+            cut -= n
+        f.seek(cut)
+        if _loads_unterminated(f.read().strip()) is not None:
+            f.write(b"\n")
+        else:
+            f.truncate(cut)
+
+
+def _loads_unterminated(line: bytes) -> Optional[Dict[str, Any]]:
+    if not line:
+        return None
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+
+def index_path_for(plan: Path) -> Path:
+    return plan.with_name(plan.name + ".idx")
+
+
+def _scan_markers(path: Path) -> List[Dict[str, Any]]:
+    # fallback for plans without (or with a stale) sidecar: one pass over
+    # raw bytes, json-decoding only the RUN_* lines
+    out: List[Dict[str, Any]] = []
+    pos = 0
+    with open(path, "rb") as f:
+        for raw in f:
+            if b'"op": "RUN_' in raw:
+                try:
+                    ev = json.loads(raw)
+                except ValueError:
+                    ev = {}
+                if ev.get("op") in RUN_MARKERS:
+                    out.append({"run_id": ev.get("run_id"), "op": ev["op"], "offset": pos, "end": pos + len(raw)})
+            pos += len(raw)
+    return out
+
+
+def _marker_ok(f: IO[bytes], m: Dict[str, Any]) -> bool:
+    try:
+        f.seek(int(m["offset"]))
+        ev = json.loads(f.readline())
+    except (ValueError, KeyError, TypeError):
+        return False
+    return ev.get("op") == m.get("op") and ev.get("run_id") == m.get("run_id")
+
+
+def _read_index(path: Path) -> Optional[List[Dict[str, Any]]]:
+    # the sidecar's markers, or None if it is missing or does not match the
+    # plan: its first marker must be the plan's first line, and the first
+    # and last markers must point at the lines they describe
+    idx = index_path_for(path)
+    if not idx.exists():
+        return None
+    try:
+        markers = sorted(read_json(idx), key=lambda m: int(m["offset"]))
+    except (ValueError, KeyError, TypeError):
+        return None
+    if not markers or int(markers[0]["offset"]) != 0:
+        return None
+    if max(int(m["end"]) for m in markers) > path.stat().st_size:
+        return None
+    with open(path, "rb") as f:
+        if _marker_ok(f, markers[0]) and _marker_ok(f, markers[-1]):
+            return markers
+    return None
+
+
+def _write_index(path: Path, markers: List[Dict[str, Any]]) -> None:
+    idx = index_path_for(path)
+    tmp = idx.with_name(idx.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8", newline="\n") as f:
+        for m in markers:
+            f.write(json.dumps(m, ensure_ascii=False) + "\n")
+    os.replace(tmp, idx)
+
+
+def load_run_markers(path: Path) -> List[Dict[str, Any]]:
+    """
+    RUN_START/RUN_RESUME/RUN_END positions in `path`, sorted by offset.
+    Uses the sidecar index when it checks out, otherwise rescans the plan.
+    """
+    markers = _read_index(path)
+    return markers if markers is not None else _scan_markers(path)
+
+
+def run_segments(path: Path, run_id: str) -> Tuple[str, List[Tuple[int, Optional[int]]]]:
+    """
+    Resolve `run_id` ("latest" = last RUN_START) to the byte ranges holding
+    its lines: one range per RUN_START/RUN_RESUME, ending after its RUN_END,
+    at the next marker of another run, or at EOF (end=None).
+    """
+    markers = load_run_markers(path)
+    if run_id == "latest":
+        starts = [m for m in markers if m["op"] == "RUN_START"]
+        if not starts:
+            raise ValueError(f"no RUN_START found in plan: {path}")
+        run_id = starts[-1]["run_id"]
+
+    segs: List[Tuple[int, Optional[int]]] = []
+    for i, m in enumerate(markers):
+        if m["run_id"] != run_id or m["op"] == "RUN_END":
+            continue
+        end: Optional[int] = None
+        if i + 1 < len(markers):
+            n = markers[i + 1]
+            end = n["end"] if (n["run_id"] == run_id and n["op"] == "RUN_END") else n["offset"]
+        segs.append((int(m["offset"]), None if end is None else int(end)))
+    if not segs:
+        raise ValueError(f"run_id not found in plan: {run_id}")
+    return run_id, segs
+
+
+def read_run(path: Path, run_id: str, reverse: bool = False) -> Generator[Dict[str, Any], None, None]:
+    """
+    Stream only the lines of one run (or "latest"), seeking past the rest.
+    """
+    run_id, segs = run_segments(path, run_id)
+    if reverse:
+        segs.reverse()
+    for start, end in segs:
+        lines = read_json_reverse(path, start, end) if reverse else read_json(path, start, end)
+        for ev in lines:
+            if ev.get("run_id") == run_id:
+                yield ev
+
+
+@dataclass
+class ResumeState:
+    run_id: str
+    config: Dict[str, Any]
+    done: Set[str]                # src paths the run already handled (OK/SKIPPED/DRY)
+    dry: List[Dict[str, Any]]     # DRY items, to re-seed name reservations and dedupe
+    ended: bool
+
+
+def load_resume_state(path: Path) -> ResumeState:
+    """
+    Collect what the last run in `path` (the last RUN_START, plus any
+    RUN_RESUME segments with the same run_id) already got through.
+    FAIL items are not counted as done, so a resume retries them.
+    """
+    state: Optional[ResumeState] = None
+    for ev in read_run(path, "latest"):
+        op = ev.get("op")
+        if op == "RUN_START":
+            state = ResumeState(str(ev.get("run_id")), ev.get("config") or {}, set(), [], False)
+            continue
+        if state is None:
+            continue
+        if op == "RUN_END":
+            state.ended = True
+        elif op == "RUN_RESUME":
+            state.ended = False
+        elif ev.get("src") and ev.get("status") in ("OK", "SKIPPED", "DRY"):
+            state.done.add(ev["src"])
+            if ev.get("status") == "DRY":
+                state.dry.append(ev)
+    if state is None:
+        raise ValueError(f"no RUN_START found in plan: {path}")
+    return state
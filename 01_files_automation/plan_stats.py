@@ -0,0 +1,282 @@
+from __future__ import annotations
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Tuple
+
+from plan_io import RUN_MARKERS, run_segments
+
+MIN_SHARD = 16 << 20      # don't split plans into byte ranges smaller than this
+TOP_CAPACITY = 1000       # distinct keys kept by TopK before it starts trimming
+
+_Range = Tuple[str, int, int]  # (plan path, start, end) in bytes
+
+
+class TopK:
+    """
+    Heaviest keys by count, in bounded memory.
+
+    Exact while at most `capacity` distinct keys have been seen; past that,
+    the table is trimmed back to the top `capacity` whenever it doubles, so
+    counts of keys that were trimmed and come back later are undercounted.
+    """
+
+    def __init__(self, capacity: int = TOP_CAPACITY) -> None:
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        self.bytes: Dict[str, int] = {}
+        self.trimmed = False
+
+    def add(self, key: str, n: int = 1, nbytes: int = 0) -> None:
+        self.counts[key] = self.counts.get(key, 0) + n
+        if nbytes:
+            self.bytes[key] = self.bytes.get(key, 0) + nbytes
+        if len(self.counts) > 2 * self.capacity:
+            self._trim()
+
+    def _trim(self) -> None:
+        keep = sorted(self.counts, key=self.counts.__getitem__, reverse=True)[:self.capacity]
+        self.counts = {k: self.counts[k] for k in keep}
+        self.bytes = {k: self.bytes[k] for k in keep if k in self.bytes}
+        self.trimmed = True
+
+    def merge(self, other: "TopK") -> None:
+        for k, n in other.counts.items():
+            self.add(k, n, other.bytes.get(k, 0))
+        self.trimmed = self.trimmed or other.trimmed
+
+    def top(self, n: int) -> List[Dict[str, Any]]:
+        keys = sorted(self.counts, key=lambda k: (-self.counts[k], k))[:n]
+        return [{"path": k, "count": self.counts[k], "bytes": self.bytes.get(k, 0)} for k in keys]
+
+
+def _bump(d: Dict[str, Any], key: str, n: int = 1) -> None:
+    d[key] = d.get(key, 0) + n
+
+
+class PlanStats:
+    """
+    Streaming aggregates over plan events. Memory grows with the number of
+    buckets, runs and reasons (small), not with the number of lines.
+    """
+
+    def __init__(self) -> None:
+        self.lines = 0
+        self.bad_lines = 0
+        self.ops: Dict[str, Dict[str, int]] = {}
+        self.buckets: Dict[str, Dict[str, int]] = {}
+        self.skip_reasons: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.runs: Dict[str, Dict[str, Any]] = {}
+        self.dups = TopK()
+
+    def feed_line(self, raw: bytes) -> None:
+        line = raw.strip()
+        if not line:
+            return
+        self.lines += 1
+        try:
+            ev = json.loads(line)
+        except ValueError:
+            # e.g. a line cut short by a crash
+            self.bad_lines += 1
+            return
+        self.feed(ev)
+
+    def feed(self, ev: Dict[str, Any]) -> None:
+        op = ev.get("op") or "?"
+        status = ev.get("status") or "?"
+        run = self.runs.setdefault(ev.get("run_id") or "?", {})
+
+        if op in RUN_MARKERS:
+            if op == "RUN_START":
+                run["mode"] = (ev.get("config") or {}).get("mode")
+                run["started"] = ev.get("ts")
+            elif op == "RUN_END":
+                run["ended"] = ev.get("ts")
+            else:
+                _bump(run, "resumed")
+            return
+
+        _bump(self.ops.setdefault(op, {}), status)
+        _bump(run, "events")
+        size = ev.get("size_bytes") or 0
+
+        if status == "ERROR":
+            _bump(run, "failed")
+            err = str(ev.get("error") or ev.get("reason") or "?")
+            _bump(self.errors, err.split(":", 1)[0][:80])
+        elif status == "SKIPPED":
+            _bump(run, "skipped")
+            reason = ev.get("reason") or "?"
+            _bump(self.skip_reasons, reason)
+            if reason == "dedupe_duplicate_of" and ev.get("duplicate_of"):
+                self.dups.add(ev["duplicate_of"], 1, size)
+        elif status in ("OK", "DRY") and op in ("MOVE", "COPY", "LINK", "STORE"):
+            _bump(run, "ok" if status == "OK" else "dry")
+            if size:
+                _bump(run, "bytes" if status == "OK" else "dry_bytes", size)
+            bucket = ev.get("bucket")
+            if bucket is None and ev.get("dst"):
+                bucket = Path(ev["dst"]).parent.name
+            b = self.buckets.setdefault(bucket or "?", {})
+            prefix = "" if status == "OK" else "dry_"
+            _bump(b, prefix + "files")
+            if size:
+                _bump(b, prefix + "bytes", size)
+        elif status == "OK":
+            _bump(run, "ok")
+
+    def merge(self, other: "PlanStats") -> None:
+        self.lines += other.lines
+        self.bad_lines += other.bad_lines
+        for op, by_status in other.ops.items():
+            mine = self.ops.setdefault(op, {})
+            for k, n in by_status.items():
+                _bump(mine, k, n)
+        for name, vals in other.buckets.items():
+            mine = self.buckets.setdefault(name, {})
+            for k, n in vals.items():
+                _bump(mine, k, n)
+        for k, n in other.skip_reasons.items():
+            _bump(self.skip_reasons, k, n)
+        for k, n in other.errors.items():
+            _bump(self.errors, k, n)
+        for rid, vals in other.runs.items():
+            mine = self.runs.setdefault(rid, {})
+            for k, v in vals.items():
+                if isinstance(v, int) and not isinstance(v, bool):
+                    _bump(mine, k, v)
+                elif v is not None:
+                    mine[k] = v
+        self.dups.merge(other.dups)
+
+    def report(self, top: int = 10) -> Dict[str, Any]:
+        return {
+            "lines": self.lines,
+            "bad_lines": self.bad_lines,
+            "ops": {op: dict(sorted(s.items())) for op, s in sorted(self.ops.items())},
+            "buckets": dict(sorted(self.buckets.items())),
+            "skip_reasons": dict(sorted(self.skip_reasons.items(), key=lambda kv: (-kv[1], kv[0]))),
+            "errors": dict(sorted(self.errors.items(), key=lambda kv: (-kv[1], kv[0]))[:top]),
+            "runs": dict(sorted(self.runs.items(), key=lambda kv: (kv[1].get("started") or "", kv[0]))),
+            "top_duplicate_sources": self.dups.top(top),
+            "top_duplicates_approx": self.dups.trimmed,
+        }
+
+
+# -----------------------
+# reading
+# -----------------------
+
+def scan_range(path: str, start: int, end: int) -> PlanStats:
+    """
+    Aggregate the lines that *start* in [start, end). A line straddling
+    `start` belongs to the previous range, one straddling `end` to this one,
+    so adjacent ranges cover every line exactly once.
+    """
+    st = PlanStats()
+    with open(path, "rb") as f:
+        if start > 0:
+            f.seek(start - 1)
+            f.readline()
+        pos = f.tell()
+        while pos < end:
+            raw = f.readline()
+            if not raw:
+                break
+            pos += len(raw)
+            st.feed_line(raw)
+    return st
+
+
+def plan_ranges(plans: Iterable[Path], run_id: str = "", shard_bytes: int = 0) -> List[_Range]:
+    """
+    Byte ranges to aggregate: whole files, or one run's segments (via the
+    .idx sidecar) with `run_id`; split into ~`shard_bytes` pieces if > 0.
+    """
+    out: List[_Range] = []
+    for plan in plans:
+        size = plan.stat().st_size
+        if run_id:
+            _, segs = run_segments(plan, run_id)
+            spans = [(s, size if e is None else e) for s, e in segs]
+        else:
+            spans = [(0, size)]
+        for s, e in spans:
+            step = e - s if shard_bytes <= 0 else shard_bytes
+            while s < e:
+                out.append((str(plan), s, min(e, s + step)))
+                s += step
+    return out
+
+
+def _scan_args(r: _Range) -> PlanStats:
+    return scan_range(*r)
+
+
+def collect_stats(plans: List[Path], run_id: str = "", jobs: int = 1) -> PlanStats:
+    """Aggregate `plans` on `jobs` processes (byte-range shards when > 1)."""
+    shard = 0
+    if jobs > 1:
+        total = sum(p.stat().st_size for p in plans)
+        shard = max(MIN_SHARD, -(-total // (jobs * 4)))
+    ranges = plan_ranges(plans, run_id, shard)
+
+    stats = PlanStats()
+    if jobs <= 1 or len(ranges) <= 1:
+        for r in ranges:
+            stats.merge(scan_range(*r))
+        return stats
+    with ProcessPoolExecutor(max_workers=min(jobs, len(ranges), os.cpu_count() or 1)) as pool:
+        for part in pool.map(_scan_args, ranges):
+            stats.merge(part)
+    return stats
+
+
+# -----------------------
+# output
+# -----------------------
+
+def _mb(n: int) -> str:
+    return f"{n / 1e6:.1f} MB"
+
+
+def format_report(rep: Dict[str, Any]) -> str:
+    out = [f"lines: {rep['lines']}" + (f" ({rep['bad_lines']} unreadable)" if rep["bad_lines"] else "")]
+
+    out.append("\nops:")
+    for op, by_status in rep["ops"].items():
+        out.append(f"  {op:<12} " + " ".join(f"{k}={n}" for k, n in by_status.items()))
+
+    if rep["buckets"]:
+        out.append("\nbuckets (done / dry-run):")
+        for name, b in rep["buckets"].items():
+            out.append(
+                f"  {name:<20} {b.get('files', 0):>8} files {_mb(b.get('bytes', 0)):>12}"
+                f"   / {b.get('dry_files', 0):>8} files {_mb(b.get('dry_bytes', 0)):>12}"
+            )
+
+    if rep["skip_reasons"]:
+        out.append("\nskip reasons:")
+        out.extend(f"  {k:<28} {n}" for k, n in rep["skip_reasons"].items())
+
+    if rep["errors"]:
+        out.append("\nerrors:")
+        out.extend(f"  {n:>8}  {k}" for k, n in rep["errors"].items())
+
+    out.append("\nruns:")
+    for rid, r in rep["runs"].items():
+        out.append(
+            f"  {rid}  {r.get('mode') or '?':<8} {r.get('started') or '?':<19}"
+            f"  events={r.get('events', 0)} ok={r.get('ok', 0)} dry={r.get('dry', 0)}"
+            f" skipped={r.get('skipped', 0)} failed={r.get('failed', 0)}"
+            + ("" if r.get("ended") else "  (no RUN_END)")
+        )
+
+    if rep["top_duplicate_sources"]:
+        approx = " (approximate)" if rep["top_duplicates_approx"] else ""
+        out.append(f"\ntop duplicate sources{approx}:")
+        out.extend(f"  {d['count']:>8}  {_mb(d['bytes']):>12}  {d['path']}" for d in rep["top_duplicate_sources"])
+    return "\n".join(out)
@@ -1,34 +1,45 @@
 from __future__ import annotations
-import hashlib
 import logging
+import os
+import time
 import uuid
+from collections import deque
+from functools import partial
 from pathlib import Path
-from typing import Dict, Tuple, Optional
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, Optional, Tuple, TypeVar, Union
 
 from config import RunConfig, validate_config
-from scanner import get_files
+from scanner import FileEntry, scan_files
 from naming import bucket_for
-from fs_ops import ensure_dir, resolve_dst, remove_if_exists, do_copy, do_move
-from plan_io import PlanWriter, read_json
-
-
-Sig = Tuple[int, str]  # (size_bytes, sha256)
-
-
-def _sha256_file(p: Path, chunk_size: int = 1024 * 1024) -> str:
-    h = hashlib.sha256()
-    with p.open("rb") as f:
-        while True:
-            b = f.read(chunk_size)
-            if not b:
-                break
-            h.update(b)
-    return h.hexdigest()
-
-
-def _sig_for(p: Path) -> Sig:
-    st = p.stat()
-    return st.st_size, _sha256_file(p)
+from fs_ops import DirCache, NameRegistry, ensure_dir, resolve_dst, remove_if_exists, do_copy, do_link, do_move
+from plan_io import PlanWriter, ResumeState, read_json, read_json_reverse, read_run
+from hash_cache import HashCache
+from scan_snapshot import DirSnapshot
+from dedupe import DEFAULT_HASH, DedupeIndex, IndexEntry
+from cas_store import ObjectStore
+from executor import OpExecutor
+from watch import FolderWatcher
+from timing import PhaseTimes
+from filters import FileFilter
+from logger_utils import ProgressLog
+
+T = TypeVar("T")
+
+
+def _remember_sig(cache: Optional[HashCache], src: Path, dst: Path, op: str, entry: IndexEntry) -> None:
+    """
+    Carry known digests over to the file we just wrote, so the next
+    dedupe run does not re-hash it.
+    """
+    if cache is None or entry.partial is None:
+        return
+    st = dst.stat()
+    if entry.digest is not None:
+        cache.put(dst, st, entry.digest, "full")
+    if entry.partial != entry.digest:
+        cache.put(dst, st, entry.partial, "partial")
+    if op == "MOVE":
+        cache.discard(src)
 
 
 def _should_skip_dedupe_path(p: Path) -> bool:
@@ -40,196 +51,530 @@ def _should_skip_dedupe_path(p: Path) -> bool:
     return False
 
 
-def build_dedupe_index(dst_root: Path, logger: logging.Logger) -> Dict[Sig, Path]:
+def build_dedupe_index(
+    dst_root: Path,
+    logger: logging.Logger,
+    cache: Optional[HashCache] = None,
+    workers: int = 1,
+    snapshot: Optional[DirSnapshot] = None,
+    algo: str = DEFAULT_HASH,
+    spill_at: int = 0,
+) -> DedupeIndex:
     """
     Scan dst_root and build signature index for --dedupe.
+
+    Only sizes are collected here; content is hashed lazily by the index
+    when a lookup hits a size collision. With a HashCache, files whose
+    (size, mtime_ns, inode) are unchanged reuse the stored digests.
+    `workers` > 1 hashes colliding files on a thread pool. With a
+    DirSnapshot, unchanged directories are replayed instead of re-listed.
+    Digests use hashlib's `algo`. Past `spill_at` files (0 = never) the
+    not-yet-hashed part of the index moves to a temp sqlite file.
     """
-    idx: Dict[Sig, Path] = {}
+    idx = DedupeIndex(cache, workers, algo, spill_at, mmap_root=dst_root)
     if not dst_root.exists():
         return idx
 
-    hashed = 0
-    for p in get_files(dst_root, True):
+    def _progress(files: int, nbytes: int) -> None:
+        logger.info("dedupe index: scanned files=%d bytes=%d ...", files, nbytes)
+
+    for fe in scan_files(dst_root, True, progress=_progress, progress_every=5000, snapshot=snapshot):
+        p = fe.path
         if _should_skip_dedupe_path(p):
             continue
         try:
-            sig = _sig_for(p)
-            idx.setdefault(sig, p)
-            hashed += 1
-            if hashed % 500 == 0:
-                logger.info("dedupe index: hashed=%d ...", hashed)
+            st = fe.stat()
+            if cache is not None and not fe.from_snapshot:
+                # a snapshot record may predate an in-place rewrite: leave
+                # those entries to be checked against a live stat
+                cache.touch(p, st)
+            idx.add_path(p, st.st_size)
         except Exception:
             continue
 
-    logger.info("dedupe index ready: files=%d", len(idx))
+    if idx.spill_path is not None:
+        logger.info("dedupe index ready: files=%d (spilled to %s)", len(idx), idx.spill_path)
+    else:
+        logger.info("dedupe index ready: files=%d", len(idx))
     return idx
 
 
-def run_sort(cfg: RunConfig, logger: logging.Logger) -> int:
+def _prefetch_hashes(
+    items: Iterable[T],
+    idx: Union[DedupeIndex, ObjectStore],
+    probe: Callable[[T], Optional[IndexEntry]],
+    window: int,
+) -> Iterator[Tuple[T, Optional[IndexEntry]]]:
+    """
+    Look `window` items ahead and queue hashing of their sources on the
+    index's (or store's) pool. Items still come out in input order; `probe` returns the
+    IndexEntry for an item that will be deduped, or None. A None item (a
+    FolderWatcher poll boundary) flushes the lookahead.
+    """
+    q: Deque[Tuple[T, Optional[IndexEntry]]] = deque()
+    for item in items:
+        if item is None:
+            # end of a --watch poll: release what is queued, then the marker,
+            # instead of holding the poll's files until a full window arrives
+            while q:
+                yield q.popleft()
+            yield item, None
+            continue
+        entry = probe(item)
+        if entry is not None:
+            idx.prefetch(entry)
+        q.append((item, entry))
+        if len(q) >= window:
+            yield q.popleft()
+    while q:
+        yield q.popleft()
+
+
+def _apply_op(
+    action: str,
+    src: Path,
+    dst_final: Path,
+    conflict_decision: str,
+    times: Optional[PhaseTimes] = None,
+    nbytes: int = 0,
+    dirs: Optional[DirCache] = None,
+) -> Tuple[str, str]:
+    """
+    Perform one COPY/MOVE and return (op, method). Runs on an OpExecutor
+    worker, so it must not touch the plan writer, counters or the dedupe index.
+    """
+    t0 = time.perf_counter()
+    ensure_dir(dst_final.parent, dirs)
+    if conflict_decision == "overwrite":
+        remove_if_exists(dst_final)
+    t1 = time.perf_counter()
+    if action == "copy":
+        op, method = "COPY", do_copy(src, dst_final)
+    else:
+        op, method = "MOVE", do_move(src, dst_final)
+    if times is not None:
+        times.add("mkdir", t1 - t0)
+        times.add(op.lower(), time.perf_counter() - t1, nbytes)
+    return op, method
+
+
+def _apply_link(
+    action: str,
+    src: Path,
+    target: Path,
+    dst_final: Path,
+    conflict_decision: str,
+    how: str,
+    times: Optional[PhaseTimes] = None,
+    dirs: Optional[DirCache] = None,
+) -> Tuple[str, str]:
+    """
+    Materialize a duplicate at dst_final as a hardlink/reflink to `target`
+    (the copy already under dst); with action "move" the source is then
+    removed. Returns ("LINK", method). Runs on an OpExecutor worker.
+    """
+    t0 = time.perf_counter()
+    ensure_dir(dst_final.parent, dirs)
+    if conflict_decision == "overwrite":
+        remove_if_exists(dst_final)
+    t1 = time.perf_counter()
+    method = do_link(target, dst_final, how)
+    if action == "move":
+        os.unlink(src)
+    if times is not None:
+        times.add("mkdir", t1 - t0)
+        times.add("link", time.perf_counter() - t1)
+    return "LINK", method
+
+
+def _apply_store(
+    action: str,
+    src: Path,
+    obj: Path,
+    obj_new: bool,
+    dst_final: Path,
+    conflict_decision: str,
+    times: Optional[PhaseTimes] = None,
+    nbytes: int = 0,
+    dirs: Optional[DirCache] = None,
+) -> Tuple[str, str]:
+    """
+    Write src into the content store (unless its object already exists)
+    and hardlink the bucket entry dst_final to the object. Returns
+    ("STORE", "<how the object was written>+<how the view was made>").
+    Runs on an OpExecutor worker.
+    """
+    t0 = time.perf_counter()
+    ensure_dir(dst_final.parent, dirs)
+    if obj_new:
+        ensure_dir(obj.parent, dirs)
+    if conflict_decision == "overwrite":
+        remove_if_exists(dst_final)
+    t1 = time.perf_counter()
+    if obj_new:
+        put = do_copy(src, obj) if action == "copy" else do_move(src, obj)
+    else:
+        put = "exists"
+    t2 = time.perf_counter()
+    view = do_link(obj, dst_final, "link")
+    if not obj_new and action == "move":
+        os.unlink(src)
+    if times is not None:
+        times.add("mkdir", t1 - t0)
+        if obj_new:
+            times.add(action, t2 - t1, nbytes)
+        times.add("link", time.perf_counter() - t2)
+    return "STORE", f"{put}+{view}"
+
+
+def _finish_phases(
+    logger: logging.Logger,
+    times: PhaseTimes,
+    summary: Dict[str, Any],
+    writer: Optional[PlanWriter],
+    idx: Optional[Union[DedupeIndex, ObjectStore]] = None,
+) -> None:
+    """Fold plan-writer and hashing totals into `times` and attach them to the summary."""
+    if writer is not None:
+        times.add("plan", writer.busy_s)
+    if idx is not None and idx.stats["bytes_hashed"]:
+        times.add("hash", 0.0, idx.stats["bytes_hashed"])
+    summary["phases"] = times.as_dict()
+    logger.info("phases: %s", times.format())
+
+
+def _log_dedupe_stats(logger: logging.Logger, idx: DedupeIndex) -> None:
+    if idx.cache is not None:
+        logger.info("dedupe stats: %s (cache hits=%d misses=%d)", idx.stats, idx.cache.hits, idx.cache.misses)
+    else:
+        logger.info("dedupe stats: %s", idx.stats)
+
+
+def run_sort(cfg: RunConfig, logger: logging.Logger, resume: Optional[ResumeState] = None) -> int:
+    """
+    Sort cfg.src into cfg.dst. With `resume`, continue that run instead of
+    starting a new one: its run_id is reused, sources it already handled are
+    skipped, and new lines are appended after a RUN_RESUME marker.
+
+    With cfg.watch the run never ends on its own: cfg.src is polled and
+    settled files go through the same pipeline, with the dedupe index, name
+    registry and plan writer kept alive between polls. Ctrl-C ends the run
+    (RUN_END is still written).
+    """
     validate_config(cfg)
+    times = PhaseTimes()
+    progress = ProgressLog(logger, "sort", cfg.progress_every)
 
-    run_id = uuid.uuid4().hex[:12]
+    run_id = resume.run_id if resume is not None else uuid.uuid4().hex[:12]
+    done_srcs = resume.done if resume is not None else set()
     plan_writer = None
 
     if cfg.plan_out is not None:
-        cfg.plan_out.parent.mkdir(parents=True, exist_ok=True)
-        plan_fp = open(cfg.plan_out, "a", encoding="utf-8", newline="\n")
-        plan_writer = PlanWriter(plan_fp, run_id, fsync=cfg.plan_fsync)
-        plan_writer.run_start(cfg.to_dict())
+        plan_writer = PlanWriter.create(
+            cfg.plan_out, run_id, fsync=cfg.plan_fsync, batch_lines=cfg.plan_batch, batch_ms=cfg.plan_batch_ms,
+        )
+        if resume is not None:
+            plan_writer.run_resume(cfg.to_dict())
+            logger.info("resuming run %s: %d items already done", run_id, len(done_srcs))
+        else:
+            plan_writer.run_start(cfg.to_dict())
         logger.info("plan -> %s", cfg.plan_out)
 
-    dedupe_idx: Dict[Sig, Path] = {}
-    if cfg.dedupe:
+    dedupe_idx = DedupeIndex()
+    hash_cache: Optional[HashCache] = None
+    snapshot: Optional[DirSnapshot] = None
+    if cfg.scan_snapshot is not None and cfg.dedupe and cfg.store != "cas":
+        # dst walk only: src files are stat'ed live, since a snapshot record
+        # goes stale when a file is rewritten in place
+        snapshot = DirSnapshot.load(cfg.scan_snapshot)
+    store: Optional[ObjectStore] = None
+    if cfg.dedupe or cfg.store == "cas":
+        if cfg.hash_cache is not None:
+            hash_cache = HashCache.load(cfg.hash_cache, cfg.hash_algo)
+            logger.info("hash cache <- %s (entries=%d)", cfg.hash_cache, len(hash_cache))
+    if cfg.store == "cas":
+        # an object path per digest: dedupe is an existence check, no dst walk
+        store = ObjectStore(cfg.dst, cfg.hash_algo, hash_cache, cfg.hash_workers)
+        logger.info("content-addressed store: %s", store.root)
+    elif cfg.dedupe:
         logger.info("building dedupe index under dst=%s ...", cfg.dst)
-        dedupe_idx = build_dedupe_index(cfg.dst, logger)
+        with times.phase("index"):
+            dedupe_idx = build_dedupe_index(cfg.dst, logger, hash_cache, cfg.hash_workers, snapshot, cfg.hash_algo,
+                                            cfg.dedupe_spill)
+
+    filt = FileFilter(cfg)
+    skip_dir = filt.prune_dir if filt.prunes else None
+    skip_counts: Dict[str, int] = {}
+
+    def _probe(fe: Optional[FileEntry]) -> Optional[IndexEntry]:
+        if fe is None:
+            return None
+        if done_srcs and str(fe.path) in done_srcs:
+            return None
+        if filt.by_name(fe.path):
+            return None
+        try:
+            st = fe.stat()
+        except OSError:
+            return None
+        if filt.by_stat(st):
+            return None
+        return IndexEntry(fe.path, st.st_size, st)
+
+    source: Iterable[Optional[FileEntry]]
+    if cfg.watch:
+        # None marks the end of a poll
+        watcher = FolderWatcher(cfg.src, cfg.recursive, cfg.watch_quiet, cfg.watch_interval, skip_dir)
+        source = watcher.stream()
+        logger.info("watching %s (interval=%ss quiet=%ss)", cfg.src, cfg.watch_interval, cfg.watch_quiet)
+    else:
+        source = scan_files(cfg.src, cfg.recursive, skip_dir=skip_dir)
+
+    files: Iterable[Tuple[Optional[FileEntry], Optional[IndexEntry]]]
+    if store is not None and cfg.hash_workers > 1:
+        files = _prefetch_hashes(source, store, _probe, cfg.hash_workers * 8)
+    elif cfg.dedupe and cfg.hash_workers > 1:
+        files = _prefetch_hashes(source, dedupe_idx, _probe, cfg.hash_workers * 8)
+    else:
+        files = ((fe, None) for fe in source)
+    files = times.iterate("scan", files)
+
+    scanned = moved = copied = linked = stored = skipped = failed = already_done = 0
+
+    ops = OpExecutor(cfg.workers)
+    names = NameRegistry()
+    dirs = DirCache()
+
+    if resume is not None:
+        # a resumed dry run never wrote its outputs: re-reserve its names
+        # and re-register its contents so later items see them
+        for ev in resume.dry:
+            names.reserve(Path(ev["dst"]))
+            if store is not None and ev.get("object"):
+                store.add(Path(ev["object"]))
+            if cfg.dedupe and ev.get("size_bytes") is not None:
+                e = IndexEntry(Path(ev["src"]), int(ev["size_bytes"]))
+                e.relocate(Path(ev["src"]), report=Path(ev["dst"]))
+                dedupe_idx.add(e)
+
+    def _emit(ev: Dict[str, Any]) -> None:
+        # plan lines go out in scan order, after any op still in flight
+        if plan_writer:
+            ops.defer(plan_writer.item, ev)
 
-    scanned = moved = copied = skipped = failed = 0
+    def _fail(f: Path, e: BaseException) -> None:
+        nonlocal failed
+        failed += 1
+        logger.error("[FAIL] %s (%s)", f, e)
+        if plan_writer:
+            plan_writer.item({
+                "op": "FAIL",
+                "status": "ERROR",
+                "wanted_op": cfg.action.upper(),
+                "src": str(f),
+                "dst": None,
+                "error": f"{type(e).__name__}: {e}",
+            })
+
+    def _done(f: Path, dst_final: Path, ev: Dict[str, Any], entry: Optional[IndexEntry],
+              res: Optional[Tuple[str, str]], err: Optional[BaseException]) -> None:
+        nonlocal moved, copied, linked, stored
+        if err is not None:
+            # we don't know how far the op got; re-list the dir on next use
+            names.invalidate(dst_final.parent)
+            dirs.forget(dst_final.parent)
+            if store is not None and ev.get("object"):
+                store.forget(Path(ev["object"]))
+            if entry is not None:
+                dedupe_idx.remove(entry)
+            _fail(f, err)
+            return
+
+        op, method = res
+        progress.add_bytes(ev.get("size_bytes") or 0)
+        if op == "COPY":
+            copied += 1
+        elif op == "LINK":
+            linked += 1
+        elif op == "STORE":
+            stored += 1
+        else:
+            moved += 1
+        logger.debug("[%s] %s -> %s (%s)", op, f, dst_final, method)
+        if plan_writer:
+            plan_writer.item(dict(ev, op=op, method=method))
+        if entry is not None:
+            entry.relocate(dst_final)
+            _remember_sig(hash_cache, f, dst_final, op, entry)
 
     try:
-        for f in get_files(cfg.src, cfg.recursive):
+        for fe, entry in files:
+            if fe is None:
+                # idle between polls: land in-flight ops and commit the plan
+                ops.drain()
+                if plan_writer:
+                    plan_writer.flush()
+                continue
+            f = fe.path
             scanned += 1
+            progress.tick()
+            if done_srcs and str(f) in done_srcs:
+                already_done += 1
+                continue
             try:
-                st = f.stat()
-                size_bytes = st.st_size
                 ext = f.suffix.lower().lstrip(".") or "no_ext"
-
-                if cfg.min_size_kb > 0 and size_bytes < cfg.min_size_kb * 1024:
+                # name rules first: files they reject are never stat'ed
+                st = None
+                reason = filt.by_name(f)
+                if reason is None:
+                    with times.phase("stat"):
+                        st = fe.stat()
+                    reason = filt.by_stat(st)
+                if reason is not None:
                     skipped += 1
-                    if plan_writer:
-                        plan_writer.item({
-                            "op": "SKIP",
-                            "status": "SKIPPED",
-                            "src": str(f),
-                            "dst": None,
-                            "size_bytes": size_bytes,
-                            "ext": ext,
-                            "reason": "size_too_small",
-                            "dry_run": cfg.dry_run,
-                        })
+                    if cfg.skip_log == "summary":
+                        skip_counts[reason] = skip_counts.get(reason, 0) + 1
+                        continue
+                    _emit({
+                        "op": "SKIP",
+                        "status": "SKIPPED",
+                        "src": str(f),
+                        "dst": None,
+                        "size_bytes": st.st_size if st is not None else None,
+                        "ext": ext,
+                        "reason": reason,
+                        "dry_run": cfg.dry_run,
+                    })
                     continue
+                size_bytes = st.st_size
 
-                if cfg.only_ext and ext not in cfg.only_ext:
-                    skipped += 1
-                    if plan_writer:
-                        plan_writer.item({
+                # dedupe (content)
+                digest: Optional[str] = None
+                link_to: Optional[Path] = None
+                obj: Optional[Path] = None
+                obj_new = False
+                if store is not None:
+                    if entry is None:
+                        entry = IndexEntry(f, size_bytes, st)
+                    with times.phase("hash"):
+                        digest = store.digest(entry)
+                    entry = None
+                    obj = store.object_path(digest)
+                    obj_new = not store.has(obj)
+                    if not obj_new and cfg.dedupe and cfg.dedupe_action == "skip":
+                        skipped += 1
+                        _emit({
                             "op": "SKIP",
                             "status": "SKIPPED",
                             "src": str(f),
                             "dst": None,
                             "size_bytes": size_bytes,
                             "ext": ext,
-                            "reason": "not_in_only_ext",
+                            "reason": "dedupe_duplicate_of",
+                            "hash_algo": cfg.hash_algo,
+                            cfg.hash_algo: digest,
+                            "duplicate_of": str(obj),
                             "dry_run": cfg.dry_run,
                         })
-                    continue
-
-                if cfg.exclude_ext and ext in cfg.exclude_ext:
-                    skipped += 1
-                    if plan_writer:
-                        plan_writer.item({
+                        continue
+                elif cfg.dedupe:
+                    if entry is None:
+                        entry = IndexEntry(f, size_bytes, st)
+                    if ops.pending and dedupe_idx.collides(size_bytes):
+                        # index entries may still be mid-move; let them land before reading them
+                        ops.drain()
+                    with times.phase("hash"):
+                        dup = dedupe_idx.find(entry)
+                    digest = entry.digest
+                    if dup is not None and cfg.dedupe_action != "skip":
+                        # still bucketed below, but as a link to the copy we have
+                        link_to = dup.report
+                        entry = None
+                    elif dup is not None:
+                        skipped += 1
+                        _emit({
                             "op": "SKIP",
                             "status": "SKIPPED",
                             "src": str(f),
                             "dst": None,
                             "size_bytes": size_bytes,
                             "ext": ext,
-                            "reason": "in_exclude_ext",
+                            "reason": "dedupe_duplicate_of",
+                            "hash_algo": cfg.hash_algo,
+                            cfg.hash_algo: digest,
+                            "duplicate_of": str(dup.report),
                             "dry_run": cfg.dry_run,
                         })
-                    continue
-
-                # dedupe (content)
-                sig: Optional[Sig] = None
-                sha256: Optional[str] = None
-                if cfg.dedupe:
-                    sig = _sig_for(f)
-                    sha256 = sig[1]
-                    if sig in dedupe_idx:
-                        skipped += 1
-                        if plan_writer:
-                            plan_writer.item({
-                                "op": "SKIP",
-                                "status": "SKIPPED",
-                                "src": str(f),
-                                "dst": None,
-                                "size_bytes": size_bytes,
-                                "ext": ext,
-                                "reason": "dedupe_duplicate_of",
-                                "sha256": sha256,
-                                "duplicate_of": str(dedupe_idx[sig]),
-                                "dry_run": cfg.dry_run,
-                            })
                         continue
 
-                bucket = bucket_for(f, st, cfg.mode)
+                with times.phase("bucket"):
+                    bucket = bucket_for(f, st, cfg.mode)
                 target_dir = cfg.dst / bucket
-                ensure_dir(target_dir)
+                with times.phase("mkdir"):
+                    ensure_dir(target_dir, dirs)
 
                 dst_base = target_dir / f.name
-                dst_final, conflict_decision = resolve_dst(dst_base, cfg.on_conflict)
+                dst_final, conflict_decision = resolve_dst(dst_base, cfg.on_conflict, names)
 
                 if conflict_decision == "skip":
                     skipped += 1
-                    if plan_writer:
-                        plan_writer.item({
-                            "op": "SKIP",
-                            "status": "SKIPPED",
-                            "src": str(f),
-                            "dst": str(dst_base),
-                            "dst_final": str(dst_final),
-                            "mode": cfg.mode,
-                            "bucket": bucket,
-                            "size_bytes": size_bytes,
-                            "ext": ext,
-                            "reason": "conflict_skip",
-                            "on_conflict": cfg.on_conflict,
-                            "dry_run": cfg.dry_run,
-                        })
+                    _emit({
+                        "op": "SKIP",
+                        "status": "SKIPPED",
+                        "src": str(f),
+                        "dst": str(dst_base),
+                        "dst_final": str(dst_final),
+                        "mode": cfg.mode,
+                        "bucket": bucket,
+                        "size_bytes": size_bytes,
+                        "ext": ext,
+                        "reason": "conflict_skip",
+                        "on_conflict": cfg.on_conflict,
+                        "dry_run": cfg.dry_run,
+                    })
                     continue
 
-                if cfg.dry_run:
-                    if plan_writer:
-                        plan_writer.item({
-                            "op": cfg.action.upper(),
-                            "status": "DRY",
-                            "src": str(f),
-                            "dst": str(dst_final),
-                            "dst_base": str(dst_base),
-                            "conflict": conflict_decision,
-                            "on_conflict": cfg.on_conflict,
-                            "mode": cfg.mode,
-                            "bucket": bucket,
-                            "size_bytes": size_bytes,
-                            "ext": ext,
-                            "sha256": sha256,
-                            "reason": "dry_run",
-                            "dry_run": True,
-                            "dedupe": cfg.dedupe,
-                        })
-                    # important: dedupe should affect later items even in dry-run
-                    if cfg.dedupe and sig is not None:
-                        dedupe_idx[sig] = Path(dst_final)
+                names.reserve(dst_final)
+
+                if obj is not None:
+                    if obj_new:
+                        store.add(obj)
+                    store.count(obj_new)
+                    ev = {
+                        "op": "STORE",
+                        "status": "DRY" if cfg.dry_run else "OK",
+                        "src": str(f),
+                        "dst": str(dst_final),
+                        "dst_base": str(dst_base),
+                        "conflict": conflict_decision,
+                        "on_conflict": cfg.on_conflict,
+                        "mode": cfg.mode,
+                        "bucket": bucket,
+                        "size_bytes": size_bytes,
+                        "ext": ext,
+                        "hash_algo": cfg.hash_algo,
+                        cfg.hash_algo: digest,
+                        "object": str(obj),
+                        "object_new": obj_new,
+                        "action": cfg.action,
+                        "reason": "dry_run" if cfg.dry_run else "matched",
+                        "dry_run": cfg.dry_run,
+                    }
+                    if cfg.dry_run:
+                        _emit(ev)
+                        continue
+                    ops.submit(
+                        partial(_apply_store, cfg.action, f, obj, obj_new, dst_final, conflict_decision,
+                                times, size_bytes, dirs),
+                        partial(_done, f, dst_final, ev, None),
+                        keys=(dst_final, obj),
+                    )
                     continue
 
-                # apply
-                dst_final.parent.mkdir(parents=True, exist_ok=True)
-                if conflict_decision == "overwrite":
-                    remove_if_exists(dst_final)
-
-                if cfg.action == "copy":
-                    do_copy(f, dst_final)
-                    copied += 1
-                    op = "COPY"
-                else:
-                    do_move(f, dst_final)
-                    moved += 1
-                    op = "MOVE"
-
-                logger.debug("[%s] %s -> %s", op, f, dst_final)
-                if plan_writer:
-                    plan_writer.item({
-                        "op": op,
-                        "status": "OK",
+                if link_to is not None:
+                    ev = {
+                        "op": "LINK",
+                        "status": "DRY" if cfg.dry_run else "OK",
                         "src": str(f),
                         "dst": str(dst_final),
                         "dst_base": str(dst_base),
@@ -239,28 +584,88 @@ def run_sort(cfg: RunConfig, logger: logging.Logger) -> int:
                         "bucket": bucket,
                         "size_bytes": size_bytes,
                         "ext": ext,
-                        "sha256": sha256,
-                        "reason": "matched",
-                        "dry_run": False,
+                        "hash_algo": cfg.hash_algo,
+                        cfg.hash_algo: digest,
+                        "duplicate_of": str(link_to),
+                        "link": cfg.dedupe_action,
+                        "action": cfg.action,
+                        "reason": "dedupe_duplicate_of",
+                        "dry_run": cfg.dry_run,
+                        "dedupe": cfg.dedupe,
+                    }
+                    if cfg.dry_run:
+                        _emit(ev)
+                        continue
+                    ops.submit(
+                        partial(_apply_link, cfg.action, f, link_to, dst_final, conflict_decision,
+                                cfg.dedupe_action, times, dirs),
+                        partial(_done, f, dst_final, ev, None),
+                        keys=(dst_final, link_to),
+                    )
+                    continue
+
+                if cfg.dry_run:
+                    _emit({
+                        "op": cfg.action.upper(),
+                        "status": "DRY",
+                        "src": str(f),
+                        "dst": str(dst_final),
+                        "dst_base": str(dst_base),
+                        "conflict": conflict_decision,
+                        "on_conflict": cfg.on_conflict,
+                        "mode": cfg.mode,
+                        "bucket": bucket,
+                        "size_bytes": size_bytes,
+                        "ext": ext,
+                        "hash_algo": cfg.hash_algo,
+                        cfg.hash_algo: digest,
+                        "reason": "dry_run",
+                        "dry_run": True,
                         "dedupe": cfg.dedupe,
                     })
+                    # important: dedupe should affect later items even in dry-run
+                    if entry is not None:
+                        entry.relocate(f, report=dst_final)
+                        dedupe_idx.add(entry)
+                    continue
 
-                if cfg.dedupe and sig is not None:
-                    dedupe_idx[sig] = dst_final
+                # apply (on the worker pool); the source stays the content path until the op lands
+                if entry is not None:
+                    entry.relocate(f, report=dst_final)
+                    dedupe_idx.add(entry)
+                ev = {
+                    "status": "OK",
+                    "src": str(f),
+                    "dst": str(dst_final),
+                    "dst_base": str(dst_base),
+                    "conflict": conflict_decision,
+                    "on_conflict": cfg.on_conflict,
+                    "mode": cfg.mode,
+                    "bucket": bucket,
+                    "size_bytes": size_bytes,
+                    "ext": ext,
+                    "hash_algo": cfg.hash_algo,
+                    cfg.hash_algo: digest,
+                    "reason": "matched",
+                    "dry_run": False,
+                    "dedupe": cfg.dedupe,
+                }
+                ops.submit(
+                    partial(_apply_op, cfg.action, f, dst_final, conflict_decision, times, size_bytes, dirs),
+                    partial(_done, f, dst_final, ev, entry),
+                    keys=(dst_final,),
+                )
 
             except Exception as e:
-                failed += 1
-                logger.error("[FAIL] %s (%s)", f, e)
-                if plan_writer:
-                    plan_writer.item({
-                        "op": "FAIL",
-                        "status": "ERROR",
-                        "wanted_op": cfg.action.upper(),
-                        "src": str(f),
-                        "dst": None,
-                        "error": f"{type(e).__name__}: {e}",
-                    })
+                ops.defer(_fail, f, e)
+        ops.drain()
+    except KeyboardInterrupt:
+        # the normal way to stop --watch; in-flight ops still land below
+        if not cfg.watch:
+            raise
+        logger.info("watch: interrupted, finishing up")
     finally:
+        ops.shutdown()
         summary = {
             "scanned": scanned,
             "moved": moved,
@@ -268,60 +673,189 @@ def run_sort(cfg: RunConfig, logger: logging.Logger) -> int:
             "skipped": skipped,
             "failed": failed,
         }
+        if cfg.dedupe_action != "skip":
+            summary["linked"] = linked
+        if store is not None:
+            summary["stored"] = stored
+        if resume is not None:
+            summary["already_done"] = already_done
+        if cfg.skip_log == "summary":
+            summary["skipped_by"] = skip_counts
         logger.info("summary: %s", summary)
+        _finish_phases(logger, times, summary, plan_writer, store if store is not None else dedupe_idx)
+        if store is not None:
+            logger.info("store: %s", store.stats)
+            store.close()
+        elif cfg.dedupe:
+            _log_dedupe_stats(logger, dedupe_idx)
+            dedupe_idx.close()
         if plan_writer:
             plan_writer.run_end(summary)
-            plan_writer.fp.close()
+            plan_writer.close()
+        if hash_cache is not None:
+            hash_cache.save()
+        if snapshot is not None:
+            logger.info("incremental scan: dirs reused=%d listed=%d", snapshot.reused, snapshot.listed)
+            snapshot.save()
 
     return 0 if failed == 0 else 2
 
 
+def _plan_events(plan_path: Path, run_id: Optional[str], reverse: bool = False) -> Iterator[Dict[str, Any]]:
+    # whole file by default; one run's segment (via the .idx sidecar) otherwise
+    if run_id:
+        return read_run(plan_path, run_id, reverse)
+    return read_json_reverse(plan_path) if reverse else read_json(plan_path)
+
+
 def run_replay(
     plan_path: Path,
     logger: logging.Logger,
     *,
     on_conflict: str = "rename",
     dedupe: bool = False,
+    dedupe_action: str = "skip",
     dry_run: bool = False,
     plan_out: Optional[Path] = None,
     plan_fsync: bool = False,
+    plan_batch: int = 1,
+    plan_batch_ms: int = 0,
     dedupe_root: Optional[Path] = None,
+    hash_cache: Optional[Path] = None,
+    hash_workers: int = 1,
+    hash_algo: str = DEFAULT_HASH,
+    run_id_in: Optional[str] = None,
+    workers: int = 1,
+    scan_snapshot: Optional[Path] = None,
+    progress_every: float = 0.0,
+    dedupe_spill: int = 0,
 ) -> int:
+    """
+    Execute the DRY COPY/MOVE/LINK/STORE lines of a plan. STORE sources
+    are re-hashed first, so an object never gets content that does not
+    match its name.
+
+    Names are resolved and dedupe decided on this thread in plan order; with
+    workers > 1 the file operations themselves run on an OpExecutor, ordered
+    per src/dst path, and output lines still follow plan order.
+    """
     if not plan_path.exists():
         raise FileNotFoundError(f"plan not found: {plan_path}")
 
+    times = PhaseTimes()
+    progress = ProgressLog(logger, "replay", progress_every)
     run_id = uuid.uuid4().hex[:12]
     writer = None
     if plan_out is not None:
-        plan_out.parent.mkdir(parents=True, exist_ok=True)
-        fp = open(plan_out, "a", encoding="utf-8", newline="\n")
-        writer = PlanWriter(fp, run_id, fsync=plan_fsync)
+        writer = PlanWriter.create(plan_out, run_id, fsync=plan_fsync, batch_lines=plan_batch, batch_ms=plan_batch_ms)
         writer.run_start({
             "mode": "replay",
             "plan_in": str(plan_path),
+            "run_id_in": run_id_in,
             "on_conflict": on_conflict,
             "dedupe": dedupe,
+            "dedupe_action": dedupe_action,
             "dry_run": dry_run,
             "dedupe_root": str(dedupe_root) if dedupe_root else None,
+            "hash_cache": str(hash_cache) if hash_cache else None,
+            "hash_workers": hash_workers,
+            "hash_algo": hash_algo,
+            "workers": workers,
+            "scan_snapshot": str(scan_snapshot) if scan_snapshot else None,
         })
         logger.info("replay plan_out -> %s", plan_out)
 
-    idx: Dict[Sig, Path] = {}
+    cache: Optional[HashCache] = None
+    if dedupe and hash_cache is not None:
+        cache = HashCache.load(hash_cache, hash_algo)
+        logger.info("replay: hash cache <- %s (entries=%d)", hash_cache, len(cache))
+    snapshot: Optional[DirSnapshot] = None
     if dedupe and dedupe_root is not None:
+        if scan_snapshot is not None:
+            snapshot = DirSnapshot.load(scan_snapshot)
         logger.info("replay: building dedupe index under %s ...", dedupe_root)
-        idx = build_dedupe_index(dedupe_root, logger)
+        with times.phase("index"):
+            idx = build_dedupe_index(dedupe_root, logger, cache, hash_workers, snapshot, hash_algo, dedupe_spill)
+    else:
+        idx = DedupeIndex(cache, hash_workers if dedupe else 1, hash_algo)
+
+    def _probe(ev: Dict[str, Any]) -> Optional[IndexEntry]:
+        if ev.get("op") not in ("COPY", "MOVE") or ev.get("status") != "DRY" or not ev.get("src"):
+            return None
+        try:
+            src = Path(ev["src"])
+            return IndexEntry(src, src.stat().st_size)
+        except OSError:
+            return None
+
+    events: Iterable[Tuple[Dict[str, Any], Optional[IndexEntry]]]
+    if dedupe and hash_workers > 1:
+        events = _prefetch_hashes(_plan_events(plan_path, run_id_in), idx, _probe, hash_workers * 8)
+    else:
+        events = ((ev, None) for ev in _plan_events(plan_path, run_id_in))
+    events = times.iterate("read", events)
 
     scanned = done = skipped = failed = 0
+    # planned dst -> where this replay really put it, for names that
+    # changed; LINK lines point at planned paths
+    moved_to: Dict[str, str] = {}
+    stores: Dict[Tuple[str, str], ObjectStore] = {}  # (objects root, algo) -> store
+    ops = OpExecutor(workers)
+    names = NameRegistry()
+    # bucket dirs are made on first use, so items skipped below (dedupe,
+    # conflict_skip, missing src) leave no empty dirs behind
+    dirs = DirCache()
+
+    def _emit(ev: Dict[str, Any]) -> None:
+        if writer:
+            ops.defer(writer.item, dict(ev, from_plan=str(plan_path)))
+
+    def _fail(op: str, src_s: Any, dst_s: Any, e: BaseException) -> None:
+        nonlocal failed
+        failed += 1
+        logger.error("[REPLAY FAIL] %s -> %s (%s)", src_s, dst_s, e)
+        if writer:
+            writer.item({
+                "op": "FAIL",
+                "status": "ERROR",
+                "wanted_op": op,
+                "src": src_s,
+                "dst": dst_s,
+                "error": f"{type(e).__name__}: {e}",
+                "from_plan": str(plan_path),
+            })
+
+    def _done(ev: Dict[str, Any], entry: Optional[IndexEntry],
+              res: Optional[Tuple[str, str]], err: Optional[BaseException]) -> None:
+        nonlocal done
+        src, dst_final = Path(ev["src"]), Path(ev["dst"])
+        if err is not None:
+            names.invalidate(dst_final.parent)
+            dirs.forget(dst_final.parent)
+            if entry is not None:
+                idx.remove(entry)
+            _fail(ev["op"], ev["src"], ev["dst_base"], err)
+            return
+
+        op, method = res
+        done += 1
+        progress.add_bytes(int(ev.get("size_bytes") or 0))
+        if writer:
+            writer.item(dict(ev, method=method, from_plan=str(plan_path)))
+        if entry is not None:
+            entry.relocate(dst_final)
+            _remember_sig(cache, src, dst_final, op, entry)
 
     try:
-        for ev in read_json(plan_path):
+        for ev, entry in events:
             op = str(ev.get("op", ""))
             status = str(ev.get("status", ""))
 
-            if op not in ("COPY", "MOVE") or status != "DRY":
+            if op not in ("COPY", "MOVE", "LINK", "STORE") or status != "DRY":
                 continue
 
             scanned += 1
+            progress.tick()
             src_s = ev.get("src")
             dst_s = ev.get("dst")
             if not src_s or not dst_s:
@@ -330,117 +864,283 @@ def run_replay(
 
             src = Path(src_s)
             dst_base = Path(dst_s)
+            # what the sort recorded about the item, for --stats
+            carry = {k: ev[k] for k in ("size_bytes", "bucket") if k in ev}
 
             try:
-                if not src.exists():
-                    raise FileNotFoundError(f"src missing: {src}")
-
-                sig = None
-                sha256 = None
-                if dedupe:
-                    sig = _sig_for(src)
-                    sha256 = sig[1]
-                    if sig in idx:
+                with times.phase("stat"):
+                    if not src.exists():
+                        raise FileNotFoundError(f"src missing: {src}")
+
+                digest = ev.get(hash_algo) if op == "LINK" else None
+                link_to: Optional[Path] = None
+                obj: Optional[Path] = None
+                obj_new = False
+                if op == "STORE":
+                    obj = Path(ev["object"])
+                    algo = str(ev.get("hash_algo") or DEFAULT_HASH)
+                    key = (str(obj.parents[2]), algo)
+                    if key not in stores:
+                        # the cache holds --hash digests; a store of another
+                        # algorithm must neither read nor fill it
+                        same = cache is not None and cache.algo == algo
+                        stores[key] = ObjectStore(obj.parents[3], algo, cache if same else None)
+                    store = stores[key]
+                    entry = IndexEntry(src, src.stat().st_size)
+                    with times.phase("hash"):
+                        digest = store.digest(entry)
+                    if digest != ev.get(algo):
+                        raise ValueError(f"src changed since the plan was made ({algo} mismatch)")
+                    obj_new = not store.has(obj)
+                    entry = None
+                elif op == "LINK":
+                    if not ev.get("duplicate_of"):
+                        raise ValueError("LINK without duplicate_of")
+                    dup_s = str(ev["duplicate_of"])
+                    link_to = Path(moved_to.get(dup_s, dup_s))
+                    entry = None
+                elif dedupe:
+                    if entry is None:
+                        entry = IndexEntry(src, src.stat().st_size)
+                    if ops.pending and idx.collides(entry.size):
+                        ops.drain()
+                    with times.phase("hash"):
+                        dup = idx.find(entry)
+                    digest = entry.digest
+                    if dup is not None and dedupe_action != "skip":
+                        link_to = dup.report
+                        entry = None
+                    elif dup is not None:
                         skipped += 1
-                        if writer:
-                            writer.item({
-                                "op": "SKIP",
-                                "status": "SKIPPED",
-                                "src": str(src),
-                                "dst": str(dst_base),
-                                "reason": "dedupe_duplicate_of",
-                                "sha256": sha256,
-                                "duplicate_of": str(idx[sig]),
-                                "dry_run": dry_run,
-                                "from_plan": str(plan_path),
-                            })
-                        continue
-
-                dst_final, conflict_decision = resolve_dst(dst_base, on_conflict)
-                if conflict_decision == "skip":
-                    skipped += 1
-                    if writer:
-                        writer.item({
+                        _emit({
                             "op": "SKIP",
                             "status": "SKIPPED",
                             "src": str(src),
                             "dst": str(dst_base),
-                            "dst_final": str(dst_final),
-                            "reason": "conflict_skip",
-                            "on_conflict": on_conflict,
+                            "reason": "dedupe_duplicate_of",
+                            "hash_algo": hash_algo,
+                            hash_algo: digest,
+                            "duplicate_of": str(dup.report),
+                            **carry,
                             "dry_run": dry_run,
-                            "from_plan": str(plan_path),
                         })
-                    continue
+                        continue
 
-                if dry_run:
-                    if writer:
-                        writer.item({
-                            "op": op,
-                            "status": "DRY",
-                            "src": str(src),
-                            "dst": str(dst_final),
-                            "dst_base": str(dst_base),
-                            "conflict": conflict_decision,
-                            "on_conflict": on_conflict,
-                            "sha256": sha256,
-                            "dry_run": True,
-                            "from_plan": str(plan_path),
-                        })
-                    if dedupe and sig is not None:
-                        idx[sig] = dst_final
+                dst_final, conflict_decision = resolve_dst(dst_base, on_conflict, names)
+                if conflict_decision == "skip":
+                    skipped += 1
+                    _emit({
+                        "op": "SKIP",
+                        "status": "SKIPPED",
+                        "src": str(src),
+                        "dst": str(dst_base),
+                        "dst_final": str(dst_final),
+                        "reason": "conflict_skip",
+                        "on_conflict": on_conflict,
+                        **carry,
+                        "dry_run": dry_run,
+                    })
                     continue
 
-                dst_final.parent.mkdir(parents=True, exist_ok=True)
-                if conflict_decision == "overwrite":
-                    remove_if_exists(dst_final)
+                names.reserve(dst_final)
+                if dst_final != dst_base:
+                    moved_to[str(dst_base)] = str(dst_final)
+
+                if obj is not None:
+                    if obj_new:
+                        store.add(obj)
+                    store.count(obj_new)
+                    store_ev = {
+                        "op": "STORE",
+                        "status": "DRY" if dry_run else "OK",
+                        "src": str(src),
+                        "dst": str(dst_final),
+                        "dst_base": str(dst_base),
+                        "conflict": conflict_decision,
+                        "on_conflict": on_conflict,
+                        "hash_algo": store.algo,
+                        store.algo: digest,
+                        "object": str(obj),
+                        "object_new": obj_new,
+                        "action": ev.get("action") or "move",
+                        **carry,
+                        "dry_run": dry_run,
+                    }
+                    if dry_run:
+                        _emit(store_ev)
+                        continue
+                    ops.submit(
+                        partial(_apply_store, store_ev["action"], src, obj, obj_new, dst_final,
+                                conflict_decision, times, int(ev.get("size_bytes") or 0), dirs),
+                        partial(_done, store_ev, None),
+                        keys=(src, dst_final, obj),
+                    )
+                    continue
 
-                if op == "COPY":
-                    do_copy(src, dst_final)
-                else:
-                    do_move(src, dst_final)
+                if link_to is not None:
+                    link_ev = {
+                        "op": "LINK",
+                        "status": "DRY" if dry_run else "OK",
+                        "src": str(src),
+                        "dst": str(dst_final),
+                        "dst_base": str(dst_base),
+                        "conflict": conflict_decision,
+                        "on_conflict": on_conflict,
+                        "hash_algo": hash_algo,
+                        hash_algo: digest,
+                        "duplicate_of": str(link_to),
+                        "link": ev.get("link") or dedupe_action,
+                        "action": ev.get("action") or op.lower(),
+                        "reason": "dedupe_duplicate_of",
+                        **carry,
+                        "dry_run": dry_run,
+                    }
+                    if dry_run:
+                        _emit(link_ev)
+                        continue
+                    ops.submit(
+                        partial(_apply_link, link_ev["action"], src, link_to, dst_final, conflict_decision,
+                                link_ev["link"], times, dirs),
+                        partial(_done, link_ev, None),
+                        keys=(src, dst_final, link_to),
+                    )
+                    continue
 
-                done += 1
-                if writer:
-                    writer.item({
+                if dry_run:
+                    _emit({
                         "op": op,
-                        "status": "OK",
+                        "status": "DRY",
                         "src": str(src),
                         "dst": str(dst_final),
                         "dst_base": str(dst_base),
                         "conflict": conflict_decision,
                         "on_conflict": on_conflict,
-                        "sha256": sha256,
-                        "dry_run": False,
-                        "from_plan": str(plan_path),
+                        "hash_algo": hash_algo,
+                        hash_algo: digest,
+                        **carry,
+                        "dry_run": True,
                     })
-                if dedupe and sig is not None:
-                    idx[sig] = dst_final
+                    if entry is not None:
+                        entry.relocate(src, report=dst_final)
+                        idx.add(entry)
+                    continue
 
-            except Exception as e:
-                failed += 1
-                logger.error("[REPLAY FAIL] %s -> %s (%s)", src_s, dst_s, e)
-                if writer:
-                    writer.item({
-                        "op": "FAIL",
-                        "status": "ERROR",
-                        "wanted_op": op,
-                        "src": src_s,
-                        "dst": dst_s,
-                        "error": f"{type(e).__name__}: {e}",
-                        "from_plan": str(plan_path),
-                    })
+                # the source stays the content path until the op lands
+                if entry is not None:
+                    entry.relocate(src, report=dst_final)
+                    idx.add(entry)
+                ok_ev = {
+                    "op": op,
+                    "status": "OK",
+                    "src": str(src),
+                    "dst": str(dst_final),
+                    "dst_base": str(dst_base),
+                    "conflict": conflict_decision,
+                    "on_conflict": on_conflict,
+                    "hash_algo": hash_algo,
+                    hash_algo: digest,
+                    **carry,
+                    "dry_run": False,
+                }
+                ops.submit(
+                    partial(_apply_op, op.lower(), src, dst_final, conflict_decision, times,
+                            entry.size if entry is not None else int(ev.get("size_bytes") or 0), dirs),
+                    partial(_done, ok_ev, entry),
+                    keys=(src, dst_final),
+                )
 
+            except Exception as e:
+                names.invalidate(dst_base.parent)
+                ops.defer(_fail, op, src_s, dst_s, e)
+        ops.drain()
     finally:
+        ops.shutdown()
         summary = {"items": scanned, "done": done, "skipped": skipped, "failed": failed}
         logger.info("replay summary: %s", summary)
+        _finish_phases(logger, times, summary, writer, idx)
+        if dedupe:
+            _log_dedupe_stats(logger, idx)
+        idx.close()
+        for store in stores.values():
+            logger.info("store %s: %s", store.root, store.stats)
+            store.close()
         if writer:
             writer.run_end(summary)
-            writer.fp.close()
+            writer.close()
+        if cache is not None:
+            cache.save()
+        if snapshot is not None:
+            logger.info("incremental scan: dirs reused=%d listed=%d", snapshot.reused, snapshot.listed)
+            snapshot.save()
 
     return 0 if failed == 0 else 2
 
 
+def _undo_op(
+    dst: Path,
+    target: Path,
+    decision: str,
+    times: Optional[PhaseTimes] = None,
+    nbytes: int = 0,
+    dirs: Optional[DirCache] = None,
+    detach: bool = False,
+) -> str:
+    """
+    Move `dst` back to `target` (the original src, or a trash slot) and
+    return the method. With `detach` (a hardlink standing in for a moved
+    file) the data is copied out and the link removed, so the restored
+    file does not share its inode with the kept duplicate. Runs on an
+    OpExecutor worker, like _apply_op.
+    """
+    t0 = time.perf_counter()
+    ensure_dir(target.parent, dirs)
+    if decision == "overwrite":
+        remove_if_exists(target)
+    t1 = time.perf_counter()
+    if detach:
+        method = do_copy(dst, target)
+        os.unlink(dst)
+    else:
+        method = do_move(dst, target)
+    if times is not None:
+        times.add("mkdir", t1 - t0)
+        times.add("move", time.perf_counter() - t1, nbytes)
+    return method
+
+
+def _undo_store(
+    view: Path,
+    obj: Path,
+    target: Optional[Path],
+    obj_new: bool,
+    moved_back: bool,
+    decision: str,
+    times: Optional[PhaseTimes] = None,
+    nbytes: int = 0,
+    dirs: Optional[DirCache] = None,
+) -> str:
+    """
+    Revert one STORE: drop the bucket view, then hand the object's content
+    to `target` (the original src, or a trash slot for a copy). An object
+    this op created and nothing else links to is moved whole; otherwise a
+    moved source is restored as a copy and the object stays in the store.
+    """
+    t0 = time.perf_counter()
+    os.unlink(view)
+    method = "unlink"
+    if target is not None:
+        ensure_dir(target.parent, dirs)
+        if decision == "overwrite":
+            remove_if_exists(target)
+        if obj_new and os.stat(obj).st_nlink <= 1:
+            method += "+" + do_move(obj, target)
+        elif moved_back:
+            method += "+" + do_copy(obj, target)
+    if times is not None:
+        times.add("move", time.perf_counter() - t0, nbytes)
+    return method
+
+
 def run_undo(
     plan_path: Path,
     logger: logging.Logger,
@@ -450,41 +1150,91 @@ def run_undo(
     trash_dir: Optional[Path] = None,
     plan_out: Optional[Path] = None,
     plan_fsync: bool = False,
+    plan_batch: int = 1,
+    plan_batch_ms: int = 0,
+    run_id_in: Optional[str] = None,
+    workers: int = 1,
+    progress_every: float = 0.0,
 ) -> int:
+    """
+    Revert the OK COPY/MOVE/LINK/STORE lines of a plan, newest first. A
+    LINK made for --action move is restored to src like a MOVE; one made
+    for copy goes to the trash like a COPY. See _undo_store for STORE.
+
+    The plan is read backwards in blocks, so a path touched twice is
+    restored in the right order and memory does not grow with the plan.
+    With workers > 1 the moves run on an OpExecutor keyed by the paths they
+    touch; an item whose dst is still being written waits for it.
+    """
     if not plan_path.exists():
         raise FileNotFoundError(f"plan not found: {plan_path}")
 
+    times = PhaseTimes()
+    progress = ProgressLog(logger, "undo", progress_every)
     run_id = uuid.uuid4().hex[:12]
     writer = None
     if plan_out is not None:
-        plan_out.parent.mkdir(parents=True, exist_ok=True)
-        fp = open(plan_out, "a", encoding="utf-8", newline="\n")
-        writer = PlanWriter(fp, run_id, fsync=plan_fsync)
+        writer = PlanWriter.create(plan_out, run_id, fsync=plan_fsync, batch_lines=plan_batch, batch_ms=plan_batch_ms)
         writer.run_start({
             "mode": "undo",
             "plan_in": str(plan_path),
+            "run_id_in": run_id_in,
             "on_conflict": on_conflict,
             "dry_run": dry_run,
             "trash_dir": str(trash_dir) if trash_dir else None,
+            "workers": workers,
         })
         logger.info("undo plan_out -> %s", plan_out)
 
     if trash_dir is None:
         trash_dir = plan_path.parent / ".undo_trash"
 
-    ensured_trash = False
-
     scanned = undone = skipped = failed = 0
+    ops = OpExecutor(workers)
+    names = NameRegistry()
+    dirs = DirCache()
+
+    def _emit(ev: Dict[str, Any]) -> None:
+        if writer:
+            ops.defer(writer.item, dict(ev, from_plan=str(plan_path)))
+
+    def _fail(op: str, src_s: Any, dst_s: Any, e: BaseException) -> None:
+        nonlocal failed
+        failed += 1
+        logger.error("[UNDO FAIL] %s %s (%s)", op, dst_s, e)
+        if writer:
+            writer.item({
+                "op": "UNDO_FAIL",
+                "status": "ERROR",
+                "undo_for": op,
+                "src": src_s,
+                "dst": dst_s,
+                "error": f"{type(e).__name__}: {e}",
+                "from_plan": str(plan_path),
+            })
+
+    def _done(op: str, target: Path, ev: Dict[str, Any], res: Optional[str], err: Optional[BaseException]) -> None:
+        nonlocal undone
+        if err is not None:
+            names.invalidate(target.parent)
+            dirs.forget(target.parent)
+            _fail(op, ev["src"], ev["dst"], err)
+            return
+        undone += 1
+        progress.add_bytes(int(ev.get("size_bytes") or 0))
+        if writer:
+            writer.item(dict(ev, method=res, from_plan=str(plan_path)))
 
     try:
-        for ev in read_json(plan_path):
+        for ev in times.iterate("read", _plan_events(plan_path, run_id_in, reverse=True)):
             op = str(ev.get("op", ""))
             status = str(ev.get("status", ""))
 
-            if op not in ("COPY", "MOVE") or status != "OK":
+            if op not in ("COPY", "MOVE", "LINK", "STORE") or status != "OK":
                 continue
 
             scanned += 1
+            progress.tick()
             src_s = ev.get("src")
             dst_s = ev.get("dst")
             if not src_s or not dst_s:
@@ -495,141 +1245,196 @@ def run_undo(
             dst = Path(dst_s)
 
             try:
-                if op == "MOVE":
-                    if not dst.exists():
+                if ops.busy(dst):
+                    # a newer item is still moving something into/out of dst
+                    ops.drain()
+                with times.phase("stat"):
+                    dst_exists = dst.exists()
+                nbytes = int(ev.get("size_bytes") or 0)
+                undo_op = f"UNDO_{op}"
+                moved_back = op == "MOVE" or (op in ("LINK", "STORE") and ev.get("action") == "move")
+
+                if op == "STORE":
+                    obj = Path(ev.get("object") or "")
+                    if ops.busy(obj):
+                        ops.drain()
+                    if not dst_exists:
                         skipped += 1
-                        if writer:
-                            writer.item({
-                                "op": "UNDO_MOVE",
-                                "status": "SKIPPED",
-                                "src": str(src),
-                                "dst": str(dst),
-                                "reason": "dst_missing",
-                                "dry_run": dry_run,
-                                "from_plan": str(plan_path),
-                            })
+                        _emit({
+                            "op": undo_op,
+                            "status": "SKIPPED",
+                            "src": str(src),
+                            "dst": str(dst),
+                            "object": str(obj),
+                            "reason": "dst_missing",
+                            "dry_run": dry_run,
+                        })
                         continue
 
-                    src_final, decision = resolve_dst(src, on_conflict)
-                    if decision == "skip":
-                        skipped += 1
-                        if writer:
-                            writer.item({
-                                "op": "UNDO_MOVE",
+                    target: Optional[Path] = None
+                    decision = "none"
+                    if moved_back:
+                        target, decision = resolve_dst(src, on_conflict, names)
+                        if decision == "skip":
+                            skipped += 1
+                            _emit({
+                                "op": undo_op,
                                 "status": "SKIPPED",
                                 "src": str(src),
-                                "src_final": str(src_final),
+                                "src_final": str(target),
                                 "dst": str(dst),
+                                "object": str(obj),
                                 "reason": "conflict_skip",
                                 "on_conflict": on_conflict,
                                 "dry_run": dry_run,
-                                "from_plan": str(plan_path),
                             })
+                            continue
+                    elif ev.get("object_new"):
+                        # a copied-in object goes to the trash once no view needs it
+                        target, decision = resolve_dst(trash_dir / obj.name, "rename", names)
+                    if target is not None:
+                        names.reserve(target)
+
+                    undo_ev = {
+                        "op": undo_op,
+                        "status": "DRY" if dry_run else "OK",
+                        "src": str(src),
+                        "dst": str(dst),
+                        "object": str(obj),
+                        "dry_run": dry_run,
+                    }
+                    if target is not None:
+                        undo_ev["src_final" if moved_back else "trash"] = str(target)
+                    if moved_back:
+                        undo_ev.update(conflict=decision, on_conflict=on_conflict)
+                    if dry_run:
+                        _emit(undo_ev)
+                        continue
+                    ops.submit(
+                        partial(_undo_store, dst, obj, target, bool(ev.get("object_new")), moved_back,
+                                decision, times, nbytes, dirs),
+                        partial(_done, op, target if target is not None else dst, undo_ev),
+                        keys=(dst, obj) if target is None else (dst, obj, target),
+                    )
+
+                elif moved_back:
+                    if not dst_exists:
+                        skipped += 1
+                        _emit({
+                            "op": undo_op,
+                            "status": "SKIPPED",
+                            "src": str(src),
+                            "dst": str(dst),
+                            "reason": "dst_missing",
+                            "dry_run": dry_run,
+                        })
                         continue
 
-                    if dry_run:
-                        if writer:
-                            writer.item({
-                                "op": "UNDO_MOVE",
-                                "status": "DRY",
-                                "src": str(src),
-                                "src_final": str(src_final),
-                                "dst": str(dst),
-                                "conflict": decision,
-                                "on_conflict": on_conflict,
-                                "dry_run": True,
-                                "from_plan": str(plan_path),
-                            })
+                    src_final, decision = resolve_dst(src, on_conflict, names)
+                    if decision == "skip":
+                        skipped += 1
+                        _emit({
+                            "op": undo_op,
+                            "status": "SKIPPED",
+                            "src": str(src),
+                            "src_final": str(src_final),
+                            "dst": str(dst),
+                            "reason": "conflict_skip",
+                            "on_conflict": on_conflict,
+                            "dry_run": dry_run,
+                        })
                         continue
 
-                    src_final.parent.mkdir(parents=True, exist_ok=True)
-                    if decision == "overwrite":
-                        remove_if_exists(src_final)
-                    do_move(dst, src_final)
+                    names.reserve(src_final)
 
-                    undone += 1
-                    if writer:
-                        writer.item({
-                            "op": "UNDO_MOVE",
-                            "status": "OK",
+                    if dry_run:
+                        _emit({
+                            "op": undo_op,
+                            "status": "DRY",
                             "src": str(src),
                             "src_final": str(src_final),
                             "dst": str(dst),
                             "conflict": decision,
                             "on_conflict": on_conflict,
-                            "dry_run": False,
-                            "from_plan": str(plan_path),
+                            "dry_run": True,
                         })
+                        continue
 
-                else:  # COPY
-                    if not dst.exists():
+                    undo_ev = {
+                        "op": undo_op,
+                        "status": "OK",
+                        "src": str(src),
+                        "src_final": str(src_final),
+                        "dst": str(dst),
+                        "conflict": decision,
+                        "on_conflict": on_conflict,
+                        "dry_run": False,
+                    }
+                    ops.submit(
+                        partial(_undo_op, dst, src_final, decision, times, nbytes, dirs,
+                                ev.get("method") == "hardlink"),
+                        partial(_done, op, src_final, undo_ev),
+                        keys=(dst, src_final),
+                    )
+
+                else:  # COPY, or a LINK next to a kept source
+                    if not dst_exists:
                         skipped += 1
-                        if writer:
-                            writer.item({
-                                "op": "UNDO_COPY",
-                                "status": "SKIPPED",
-                                "src": str(src),
-                                "dst": str(dst),
-                                "reason": "dst_missing",
-                                "dry_run": dry_run,
-                                "from_plan": str(plan_path),
-                            })
+                        _emit({
+                            "op": undo_op,
+                            "status": "SKIPPED",
+                            "src": str(src),
+                            "dst": str(dst),
+                            "reason": "dst_missing",
+                            "dry_run": dry_run,
+                        })
                         continue
 
-                    if not ensured_trash and not dry_run:
-                        trash_dir.mkdir(parents=True, exist_ok=True)
-                        ensured_trash = True
+                    if not dry_run:
+                        ensure_dir(trash_dir, dirs)
 
                     trash_path = trash_dir / dst.name
                     # avoid overwrite in trash
-                    trash_final, _ = resolve_dst(trash_path, "rename")
+                    trash_final, _ = resolve_dst(trash_path, "rename", names)
+                    names.reserve(trash_final)
 
                     if dry_run:
-                        if writer:
-                            writer.item({
-                                "op": "UNDO_COPY",
-                                "status": "DRY",
-                                "src": str(src),
-                                "dst": str(dst),
-                                "trash": str(trash_final),
-                                "dry_run": True,
-                                "from_plan": str(plan_path),
-                            })
-                        continue
-
-                    do_move(dst, trash_final)
-
-                    undone += 1
-                    if writer:
-                        writer.item({
-                            "op": "UNDO_COPY",
-                            "status": "OK",
+                        _emit({
+                            "op": undo_op,
+                            "status": "DRY",
                             "src": str(src),
                             "dst": str(dst),
                             "trash": str(trash_final),
-                            "dry_run": False,
-                            "from_plan": str(plan_path),
+                            "dry_run": True,
                         })
+                        continue
 
-            except Exception as e:
-                failed += 1
-                logger.error("[UNDO FAIL] %s %s (%s)", op, dst_s, e)
-                if writer:
-                    writer.item({
-                        "op": "UNDO_FAIL",
-                        "status": "ERROR",
-                        "undo_for": op,
-                        "src": src_s,
-                        "dst": dst_s,
-                        "error": f"{type(e).__name__}: {e}",
-                        "from_plan": str(plan_path),
-                    })
+                    undo_ev = {
+                        "op": undo_op,
+                        "status": "OK",
+                        "src": str(src),
+                        "dst": str(dst),
+                        "trash": str(trash_final),
+                        "dry_run": False,
+                    }
+                    ops.submit(
+                        partial(_undo_op, dst, trash_final, "rename", times, nbytes, dirs),
+                        partial(_done, op, trash_final, undo_ev),
+                        keys=(dst, trash_final),
+                    )
 
+            except Exception as e:
+                names.invalidate(src.parent)
+                names.invalidate(trash_dir)
+                ops.defer(_fail, op, src_s, dst_s, e)
+        ops.drain()
     finally:
+        ops.shutdown()
         summary = {"items": scanned, "undone": undone, "skipped": skipped, "failed": failed}
         logger.info("undo summary: %s", summary)
+        _finish_phases(logger, times, summary, writer)
         if writer:
             writer.run_end(summary)
-            writer.fp.close()
+            writer.close()
 
     return 0 if failed == 0 else 2
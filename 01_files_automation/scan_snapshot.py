@@ -0,0 +1,110 @@
+from __future__ import annotations
+import json
+import os
+import time
+from os import stat_result
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+SNAPSHOT_VERSION = 1
+
+# a directory touched this close to the scan may still change within the
+# same mtime tick, so its listing is not worth trusting next time
+_SETTLE_NS = 2 * 10**9
+
+FileRec = List  # [name, size, mtime_ns, ino, mode]
+Listing = Tuple[List[FileRec], List[str]]  # (files, subdir names)
+
+
+def file_rec(name: str, st: stat_result) -> FileRec:
+    return [name, st.st_size, st.st_mtime_ns, st.st_ino, st.st_mode]
+
+
+def stat_from_rec(rec: FileRec) -> stat_result:
+    """Rebuild the stat fields we care about from a snapshot record."""
+    _name, size, mtime_ns, ino, mode = rec
+    secs = mtime_ns // 10**9
+    return os.stat_result(
+        (mode, ino, 0, 1, 0, 0, size, secs, secs, secs),
+        {"st_mtime": mtime_ns / 1e9, "st_mtime_ns": mtime_ns},
+    )
+
+
+class SnapshotView:
+    """The part of a DirSnapshot that belongs to one scan root."""
+
+    def __init__(self, snap: "DirSnapshot", old: Dict[str, List], new: Dict[str, List]) -> None:
+        self._snap = snap
+        self._old = old
+        self._new = new
+
+    def get(self, d: str) -> Tuple[Optional[Listing], int]:
+        """
+        Return (cached listing or None, current dir mtime_ns).
+        """
+        mtime_ns = os.stat(d).st_mtime_ns
+        ent = self._old.get(d)
+        if ent is not None and ent[0] == mtime_ns:
+            self._new[d] = ent
+            self._snap.reused += 1
+            return (ent[1], ent[2]), mtime_ns
+        return None, mtime_ns
+
+    def put(self, d: str, mtime_ns: int, files: List[FileRec], subdirs: List[str]) -> None:
+        self._snap.listed += 1
+        if mtime_ns < self._snap.cutoff_ns:
+            self._new[d] = [mtime_ns, files, subdirs]
+
+
+class DirSnapshot:
+    """
+    Directory listings from the previous --incremental-scan run.
+
+    Each directory is stored with its mtime_ns, its files (name + the stat
+    fields scanning needs) and its subdirectory names. A directory whose
+    mtime is unchanged had no entries added, removed or renamed, so its
+    listing is replayed instead of scandir + stat; its subdirectories are
+    still visited, because their changes don't bubble up. Files rewritten
+    in place keep stale sizes/mtimes until their directory changes, which
+    is why only the dedupe walk of dst uses it, never the src scan.
+    """
+
+    def __init__(self, path: Optional[Path]) -> None:
+        self.path = path
+        self._roots: Dict[str, Dict[str, List]] = {}  # root -> dir -> [mtime_ns, files, subdirs]
+        self._views: Dict[str, Dict[str, List]] = {}
+        self.cutoff_ns = time.time_ns() - _SETTLE_NS
+        self.reused = 0
+        self.listed = 0
+
+    @classmethod
+    def load(cls, path: Optional[Path]) -> "DirSnapshot":
+        snap = cls(path)
+        if path is None or not path.exists():
+            return snap
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                doc = json.load(f)
+            if doc.get("version") == SNAPSHOT_VERSION:
+                snap._roots = dict(doc.get("roots", {}))
+        except (OSError, ValueError):
+            # like the hash cache: a broken snapshot only means a full walk
+            snap._roots = {}
+        return snap
+
+    def view(self, root: Path) -> SnapshotView:
+        key = os.path.abspath(str(root))
+        new = self._views[key] = {}
+        return SnapshotView(self, self._roots.get(key, {}), new)
+
+    def save(self) -> None:
+        """Replace the roots scanned this run; keep the others as they were."""
+        if self.path is None or not self._views:
+            return
+        roots = dict(self._roots)
+        roots.update(self._views)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": SNAPSHOT_VERSION, "roots": roots}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
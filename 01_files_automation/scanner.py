@@ -1,6 +1,137 @@
 from __future__ import annotations
+import os
+from os import stat_result
 from pathlib import Path
-from typing import Iterator
+from typing import Callable, Iterator, List, Optional
+
+from scan_snapshot import DirSnapshot, FileRec, file_rec, stat_from_rec
+
+ProgressFn = Callable[[int, int], None]  # (files, bytes)
+
+
+class FileEntry:
+    """
+    A scanned file: its path plus the stat info the scan already paid for.
+
+    stat() is served from the DirEntry (free on Windows, one cached call
+    on POSIX), so callers never stat the same file twice. On Windows that
+    result has st_ino, st_dev and st_nlink set to 0; use Path.stat() when
+    those are needed.
+    """
+    __slots__ = ("path", "_dirent", "_st")
+
+    def __init__(
+        self,
+        path: Path,
+        dirent: Optional[os.DirEntry] = None,
+        st: Optional[stat_result] = None,
+    ) -> None:
+        self.path = path
+        self._dirent = dirent
+        self._st = st
+
+    @property
+    def name(self) -> str:
+        return self._dirent.name if self._dirent is not None else self.path.name
+
+    @property
+    def from_snapshot(self) -> bool:
+        """True if stat() is a DirSnapshot record, possibly out of date."""
+        return self._dirent is None and self._st is not None
+
+    def stat(self) -> stat_result:
+        if self._st is None:
+            if self._dirent is not None:
+                self._st = self._dirent.stat()
+            else:
+                self._st = self.path.stat()
+        return self._st
+
+    def __repr__(self) -> str:
+        return f"FileEntry({str(self.path)!r})"
+
+
+def scan_files(
+    src: Path,
+    recursive: bool,
+    progress: Optional[ProgressFn] = None,
+    progress_every: int = 1000,
+    snapshot: Optional[DirSnapshot] = None,
+    skip_dir: Optional[Callable[[str], bool]] = None,
+) -> Iterator[FileEntry]:
+    """
+    Yield FileEntry for every regular file under `src` using os.scandir.
+
+    Symlinked directories are not descended into. `progress(files, bytes)`
+    is called every `progress_every` files and once at the end.
+
+    With a `snapshot` (recursive scans only), directories whose mtime is
+    unchanged since the snapshot are replayed from it instead of listed;
+    files and order come out the same either way. Subdirectories for which
+    `skip_dir(path)` is true are not descended into.
+    """
+    view = snapshot.view(src) if snapshot is not None and recursive else None
+    files = total = 0
+    stack: List[str] = [str(src)]
+    while stack:
+        d = stack.pop()
+        mtime_ns = 0
+        if view is not None:
+            try:
+                cached, mtime_ns = view.get(d)
+            except OSError:
+                continue
+            if cached is not None:
+                recs, names = cached
+                for rec in recs:
+                    fe = FileEntry(Path(os.path.join(d, rec[0])), st=stat_from_rec(rec))
+                    if progress is not None:
+                        files += 1
+                        total += rec[1]
+                        if files % progress_every == 0:
+                            progress(files, total)
+                    yield fe
+                _push(stack, [os.path.join(d, n) for n in names], skip_dir)
+                continue
+        try:
+            it = os.scandir(d)
+        except OSError:
+            continue
+        subdirs: List[str] = []
+        listed: List[FileRec] = []
+        ok = True
+        with it:
+            for de in it:
+                try:
+                    if de.is_file():
+                        fe = FileEntry(Path(de.path), de)
+                        if view is not None:
+                            listed.append(file_rec(de.name, fe.stat()))
+                        if progress is not None:
+                            files += 1
+                            total += fe.stat().st_size
+                            if files % progress_every == 0:
+                                progress(files, total)
+                        yield fe
+                    elif recursive and de.is_dir(follow_symlinks=False):
+                        subdirs.append(de.path)
+                except OSError:
+                    # an entry we could not stat: don't remember this listing
+                    ok = False
+                    continue
+        if view is not None and ok:
+            view.put(d, mtime_ns, listed, [os.path.basename(p) for p in subdirs])
+        _push(stack, subdirs, skip_dir)
+    if progress is not None:
+        progress(files, total)
+
+
+def _push(stack: List[str], subdirs: List[str], skip_dir: Optional[Callable[[str], bool]]) -> None:
+    # depth-first, in listing order
+    if skip_dir is not None:
+        subdirs = [p for p in subdirs if not skip_dir(p)]
+    stack.extend(reversed(subdirs))
+
 
 def get_files(src: Path, recursive: bool) -> Iterator[Path]:
     """
@@ -8,11 +139,5 @@ def get_files(src: Path, recursive: bool) -> Iterator[Path]:
 
     Returns an iterator to avoid building a full list in memory.
     """
-    if recursive:
-        for p in src.rglob("*"):
-            if p.is_file():
-                yield p
-    else:
-        for p in src.iterdir():
-            if p.is_file():
-                yield p
+    for fe in scan_files(src, recursive):
+        yield fe.path
@@ -0,0 +1,110 @@
+"""
+--watch end to end: a tool.py process sorts files dropped into src.
+
+    python -m unittest discover -s 01_files_automation/tests
+"""
+from __future__ import annotations
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from typing import Any, Dict, List
+
+TOOL = Path(__file__).resolve().parent.parent / "tool.py"
+
+
+def _plan_events(plan: Path) -> List[Dict[str, Any]]:
+    out = []
+    if plan.exists():
+        for line in plan.read_text(encoding="utf-8").splitlines():
+            try:
+                out.append(json.loads(line))
+            except ValueError:
+                pass  # a line still being written
+    return out
+
+
+def _wait_for(cond, timeout: float = 15.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if cond():
+            return True
+        time.sleep(0.1)
+    return cond()
+
+
+@unittest.skipUnless(os.name == "posix", "stops the watcher with SIGINT")
+class WatchTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = Path(tempfile.mkdtemp(prefix="watch-test-"))
+        self.src = self.tmp / "src"
+        self.dst = self.tmp / "dst"
+        self.src.mkdir()
+        self.dst.mkdir()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _watch(self, extra: List[str]) -> subprocess.Popen:
+        return subprocess.Popen(
+            [sys.executable, str(TOOL), "--src", str(self.src), "--dst", str(self.dst), "--watch",
+             "--watch-interval", "0.5", "--watch-quiet", "0.3", "--log-level", "WARNING", *extra],
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+
+    def _stop(self, proc: subprocess.Popen) -> None:
+        if proc.poll() is None:
+            proc.send_signal(signal.SIGINT)
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+            self.fail("watch did not stop on SIGINT")
+
+    def _drop_and_check(self, extra: List[str]) -> List[Dict[str, Any]]:
+        (self.dst / "txt").mkdir()
+        (self.dst / "txt" / "old.txt").write_text("dup")
+        plan = self.dst / "logs" / "plan.jsonl"
+        proc = self._watch(extra)
+        try:
+            time.sleep(0.5)
+            (self.src / "a.txt").write_text("a")
+            (self.src / "b.log").write_text("b")
+            (self.src / "c.txt").write_text("dup")
+            # every dropped file gets its plan line (committed at the end of a
+            # poll) within a few polls; a lookahead that holds files until
+            # hash_workers * 8 poll markers have passed would take 8s here
+            handled = _wait_for(lambda: len({e.get("src") for e in _plan_events(plan) if e.get("src")}) >= 3, 5.0)
+        finally:
+            self._stop(proc)
+        self.assertTrue(handled, f"still in src: {sorted(p.name for p in self.src.iterdir())}")
+        self.assertEqual((self.dst / "txt" / "a.txt").read_text(), "a")
+        self.assertEqual((self.dst / "log" / "b.log").read_text(), "b")
+        self.assertFalse((self.src / "a.txt").exists())
+
+        events = _plan_events(plan)
+        self.assertEqual(events[-1]["op"], "RUN_END")
+        return events
+
+    def test_watch_sorts_dropped_files(self) -> None:
+        self._drop_and_check([])
+
+    def test_watch_with_hash_workers(self) -> None:
+        # the prefetch lookahead must not hold a poll's files back
+        events = self._drop_and_check(["--dedupe", "--hash-workers", "2"])
+        dups = [e for e in events if e.get("reason") == "dedupe_duplicate_of"]
+        self.assertEqual([Path(e["src"]).name for e in dups], ["c.txt"])
+
+    def test_watch_cas_with_hash_workers(self) -> None:
+        self._drop_and_check(["--store", "cas", "--hash-workers", "2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+from __future__ import annotations
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+
+class PhaseTimes:
+    """
+    Cumulative wall time (time.perf_counter) and bytes per phase.
+
+    Cheap enough for the per-file hot path. Phases that run on worker
+    threads (copy/move) are summed across workers, so they can add up to
+    more than the run's wall time.
+    """
+
+    def __init__(self) -> None:
+        self._secs: Dict[str, float] = {}
+        self._bytes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._t0 = time.perf_counter()
+
+    def add(self, name: str, secs: float, nbytes: int = 0) -> None:
+        with self._lock:
+            self._secs[name] = self._secs.get(name, 0.0) + secs
+            if nbytes:
+                self._bytes[name] = self._bytes.get(name, 0) + nbytes
+
+    @contextmanager
+    def phase(self, name: str, nbytes: int = 0) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0, nbytes)
+
+    def iterate(self, name: str, items: Iterable[T]) -> Iterator[T]:
+        """Pass `items` through, charging the time spent producing them to `name`."""
+        it = iter(items)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                self.add(name, time.perf_counter() - t0)
+                return
+            self.add(name, time.perf_counter() - t0)
+            yield item
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = {"total_s": round(time.perf_counter() - self._t0, 4)}
+            for name, secs in self._secs.items():
+                ph: Dict[str, Any] = {"s": round(secs, 4)}
+                if name in self._bytes:
+                    ph["bytes"] = self._bytes[name]
+                out[name] = ph
+            return out
+
+    def format(self) -> str:
+        d = self.as_dict()
+        parts = [f"total={d.pop('total_s'):.3f}s"]
+        for name, ph in d.items():
+            s = f"{name}={ph['s']:.3f}s"
+            if ph.get("bytes") and ph["s"] > 0:
+                s += f" ({ph['bytes'] / ph['s'] / 1e6:.1f} MB/s)"
+            parts.append(s)
+        return " ".join(parts)
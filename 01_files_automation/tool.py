@@ -1,9 +1,17 @@
 import argparse
+import cProfile
+import json
+import os
+import tempfile
 import logging
 from pathlib import Path
+from typing import Any, Callable, Optional
 
-from config import RunConfig, parse_ext_list
+from config import RunConfig, parse_ext_list, parse_time_bound
+from dedupe import DEFAULT_HASH, HASH_ALGOS, probe_hash_speed
 from logger_utils import setup_logging
+from plan_io import ResumeState, load_resume_state, run_segments
+from plan_stats import collect_stats, format_report
 from runner import run_sort, run_replay, run_undo
 
 
@@ -15,13 +23,32 @@ def build_parser() -> argparse.ArgumentParser:
     ap.add_argument("--dst", default="", help="destination directory (normal run)")
 
     ap.add_argument("--recursive", action="store_true", help="scan recursively (normal run)")
-    ap.add_argument("--mode", choices=["ext", "date"], default="ext", help="bucket mode (normal run)")
+    ap.add_argument("--mode", choices=["ext", "date", "capture-date"], default="ext",
+                    help="bucket mode (normal run); capture-date reads EXIF/video header time, else mtime")
     ap.add_argument("--action", choices=["copy", "move"], default="move", help="copy or move (normal run)")
     ap.add_argument("--dry-run", action="store_true", help="plan only, no filesystem changes")
+    ap.add_argument("--workers", type=int, default=1, help="run up to N copy/move operations concurrently (normal run, replay and undo; default: 1)")
+
+    ap.add_argument("--watch", action="store_true",
+                    help="keep running: poll --src and sort files once they have settled (Ctrl-C to stop)")
+    ap.add_argument("--watch-interval", type=float, default=2.0, help="watch: seconds between polls (default: 2)")
+    ap.add_argument("--watch-quiet", type=float, default=10.0,
+                    help="watch: seconds a file must stay unchanged before it is sorted (default: 10)")
 
     ap.add_argument("--only-ext", default="", help="only include these extensions: jpg,png")
     ap.add_argument("--exclude-ext", default="", help="exclude these extensions: tmp,part")
     ap.add_argument("--min-size-kb", type=int, default=0, help="skip files smaller than this")
+    ap.add_argument("--max-size-kb", type=int, default=0, help="skip files larger than this (0 = no limit)")
+    ap.add_argument("--include", action="append", default=[], metavar="PATTERN",
+                    help="only sort paths (relative to --src) matching this glob, or regex with 're:' (repeatable)")
+    ap.add_argument("--exclude", action="append", default=[], metavar="PATTERN",
+                    help="skip paths matching this glob / 're:' regex (repeatable)")
+    ap.add_argument("--exclude-dir", action="append", default=[], metavar="PATTERN",
+                    help="don't descend into directories matching this glob / 're:' regex (repeatable)")
+    ap.add_argument("--mtime-after", default="", help="skip files modified before this: YYYY-MM-DD[THH:MM] or an age like 7d/12h")
+    ap.add_argument("--mtime-before", default="", help="skip files modified at/after this: YYYY-MM-DD[THH:MM] or 7d/12h")
+    ap.add_argument("--skip-log", choices=["events", "summary"], default="events",
+                    help="filtered files: one SKIP line each (events) or only counts in RUN_END (summary)")
 
     # new: conflict + dedupe
     ap.add_argument(
@@ -31,20 +58,64 @@ def build_parser() -> argparse.ArgumentParser:
         help="when dst exists: rename/skip/overwrite/fail",
     )
     ap.add_argument("--dedupe", action="store_true", help="skip files whose content already exists under dst")
+    ap.add_argument("--dedupe-action", choices=["skip", "link", "reflink"], default="skip",
+                    help="dedupe: what to do with a duplicate: skip it, or put it in its bucket as a "
+                         "hardlink/reflink to the existing copy (no data copied; undo reverts it)")
+    ap.add_argument("--store", choices=["plain", "cas"], default="plain",
+                    help="normal run: 'cas' writes each distinct content once to <dst>/objects/ab/cd/<hash> "
+                         "and makes the buckets hardlinks to it (--dedupe then skips content already stored)")
+    ap.add_argument("--hash-cache", default="", help="dedupe: persistent hash cache file (default: <dst>/logs/hash_cache.json)")
+    ap.add_argument("--no-hash-cache", action="store_true", help="dedupe: always re-hash, don't read/write the hash cache")
+    ap.add_argument("--incremental-scan", action="store_true",
+                    help="dedupe: reuse listings of dst directories unchanged since the last run "
+                         "(snapshot in <dst>/logs/scan_snapshot.json); src is always walked fresh")
+    ap.add_argument("--hash-workers", type=int, default=1, help="dedupe: hash files on N threads (default: 1)")
+    ap.add_argument("--dedupe-spill", type=int, default=2_000_000, metavar="FILES",
+                    help="dedupe: keep up to FILES not-yet-hashed dst files in memory, "
+                         "then move them to a temp sqlite file (default: 2000000; 0 = never)")
+    ap.add_argument("--hash", dest="hash_algo", choices=HASH_ALGOS, default=DEFAULT_HASH,
+                    help="dedupe: content hash; recorded in plan events (default: sha256)")
+    ap.add_argument("--hash-probe", nargs="?", const="-", default="", metavar="FILE",
+                    help="measure hash throughput of every --hash choice and read method, on FILE "
+                         "or a 64 MiB temp file, then exit")
 
     # plan infra
     ap.add_argument("--plan-out", default="", help="path to output plan.jsonl (JSON Lines)")
     ap.add_argument("--plan-fsync", action="store_true", help="fsync every plan line (slower but safer)")
+    ap.add_argument("--plan-batch", type=int, default=1,
+                    help="group commit: write/fsync plan lines every N lines (default: 1 = every line)")
+    ap.add_argument("--plan-batch-ms", type=int, default=0,
+                    help="group commit: also write/fsync at least every T ms (default: 0 = off)")
 
     # new: replay/undo
     mx = ap.add_mutually_exclusive_group()
     mx.add_argument("--replay", default="", help="replay a DRY plan.jsonl to execute actions")
     mx.add_argument("--undo", default="", help="undo a plan.jsonl (revert MOVE, trash COPY outputs)")
+    mx.add_argument("--resume", default="",
+                    help="continue the last run recorded in this plan.jsonl (same run_id, skips items already done)")
+    mx.add_argument("--stats", nargs="+", default=[], metavar="PLAN",
+                    help="report totals from one or more plan.jsonl files (bytes per bucket, skips, failures per run, ...)")
 
+    ap.add_argument("--run-id", default="",
+                    help="replay/undo/stats: only this run of the plan (an id, or 'latest'); seeks via <plan>.idx")
     ap.add_argument("--trash-dir", default="", help="undo: where to put removed COPY outputs (default: <plan_dir>/.undo_trash)")
 
+    ap.add_argument("--stats-jobs", type=int, default=1,
+                    help="stats: aggregate byte-range shards of the plans on N processes (default: 1)")
+    ap.add_argument("--stats-top", type=int, default=10, help="stats: entries in top-N lists (default: 10)")
+    ap.add_argument("--stats-json", action="store_true", help="stats: print the report as JSON")
+
+    ap.add_argument("--profile", nargs="?", const="auto", default="",
+                    help="write a cProfile/pstats dump of the run (default path: next to the log file, .pstats)")
+
     ap.add_argument("--log-file", default="", help="log file path (optional)")
     ap.add_argument("--log-level", default="INFO", help="console log level: DEBUG/INFO/WARNING/ERROR")
+    ap.add_argument("--log-queue", type=int, default=0, metavar="N",
+                    help="log through a queue of N records to a background thread (default: 0 = write inline)")
+    ap.add_argument("--log-queue-policy", choices=["block", "drop"], default="block",
+                    help="log queue full: wait for it, or drop DEBUG/INFO records (counted, reported at exit)")
+    ap.add_argument("--progress-every", type=float, default=5.0, metavar="SECONDS",
+                    help="log a files/s + MB/s progress line at most this often (default: 5; 0 = off)")
     return ap
 
 
@@ -56,6 +127,14 @@ def _default_log_file_for_normal(dst: Path) -> Path:
     return dst / "logs" / "run.log"
 
 
+def _default_hash_cache_for_normal(dst: Path) -> Path:
+    return dst / "logs" / "hash_cache.json"
+
+
+def _default_scan_snapshot(dst: Path) -> Path:
+    return dst / "logs" / "scan_snapshot.json"
+
+
 def _default_plan_out_for_plan(plan_in: Path, suffix: str) -> Path:
     # e.g. plan_replay.jsonl / plan_undo.jsonl
     return plan_in.with_name(f"{plan_in.stem}_{suffix}.jsonl")
@@ -65,33 +144,147 @@ def _default_log_file_for_plan(plan_in: Path, suffix: str) -> Path:
     return plan_in.with_name(f"{plan_in.stem}_{suffix}.log")
 
 
+# settings that define *what* a run does; --resume takes them from the plan
+_RESUMED_SETTINGS = (
+    "src", "dst", "recursive", "mode", "action", "dry_run",
+    "only_ext", "exclude_ext", "min_size_kb", "max_size_kb", "include", "exclude", "exclude_dir",
+    "mtime_after", "mtime_before", "on_conflict", "dedupe", "dedupe_action", "store", "hash_algo",
+)
+
+
+def _apply_resumed_settings(args: argparse.Namespace, state: ResumeState) -> None:
+    saved = state.config
+    for key in _RESUMED_SETTINGS:
+        if key not in saved:
+            continue
+        val = saved[key]
+        if key in ("only_ext", "exclude_ext"):
+            val = ",".join(val or [])
+        setattr(args, key, val)
+
+
+def _profile_path(arg: str, log_file: Path) -> Optional[Path]:
+    if not arg:
+        return None
+    return log_file.with_suffix(".pstats") if arg == "auto" else Path(arg)
+
+
+def _call(profile: Optional[Path], fn: Callable[..., int], *args: Any, **kwargs: Any) -> int:
+    # cProfile only sees the main thread; worker time shows up in the RUN_END phases
+    if profile is None:
+        return fn(*args, **kwargs)
+    prof = cProfile.Profile()
+    try:
+        return prof.runcall(fn, *args, **kwargs)
+    finally:
+        profile.parent.mkdir(parents=True, exist_ok=True)
+        prof.dump_stats(str(profile))
+
+
+def _hash_probe(sample_arg: str) -> int:
+    if sample_arg != "-":
+        sample = Path(sample_arg)
+        rows = probe_hash_speed(sample)
+    else:
+        with tempfile.TemporaryDirectory(prefix="hash_probe_") as tmp:
+            sample = Path(tmp) / "sample.bin"
+            with open(sample, "wb") as f:
+                for _ in range(64):
+                    f.write(os.urandom(1 << 20))
+            rows = probe_hash_speed(sample)
+    print(f"{'algo':<10} {'method':<10} {'MB/s':>10}")
+    for r in rows:
+        print(f"{r['algo']:<10} {r['method']:<10} {r['mb_per_s']:>10}")
+    best = rows[0]
+    print(f"fastest: --hash {best['algo']} ({best['method']})")
+    return 0
+
+
+def _check_run_id(ap: argparse.ArgumentParser, plan_in: Path, run_id: str) -> None:
+    if not run_id or not plan_in.exists():
+        return
+    try:
+        run_segments(plan_in, run_id)
+    except ValueError as e:
+        ap.error(str(e))
+
+
 def main() -> None:
     ap = build_parser()
     args = ap.parse_args()
 
     console_level = getattr(logging, args.log_level.upper(), logging.INFO)
 
+    # -----------------------
+    # hash throughput probe
+    # -----------------------
+    if args.hash_probe:
+        raise SystemExit(_hash_probe(args.hash_probe))
+
+    # -----------------------
+    # stats mode (read-only, no log/plan output)
+    # -----------------------
+    if args.stats:
+        plans = [Path(p) for p in args.stats]
+        missing = [str(p) for p in plans if not p.is_file()]
+        if missing:
+            ap.error(f"--stats: no such plan: {', '.join(missing)}")
+        for p in plans:
+            _check_run_id(ap, p, args.run_id)
+        stats = collect_stats(plans, run_id=args.run_id, jobs=max(1, args.stats_jobs))
+        report = stats.report(top=max(1, args.stats_top))
+        if args.stats_json:
+            print(json.dumps({"plans": [str(p) for p in plans], "run_id": args.run_id or None, **report},
+                             ensure_ascii=False, indent=2))
+        else:
+            print(format_report(report))
+        raise SystemExit(0)
+
     # -----------------------
     # replay mode
     # -----------------------
     if args.replay:
         plan_in = Path(args.replay)
+        _check_run_id(ap, plan_in, args.run_id)
         plan_out = Path(args.plan_out) if args.plan_out else _default_plan_out_for_plan(plan_in, "replay")
         log_file = Path(args.log_file) if args.log_file else _default_log_file_for_plan(plan_in, "replay")
-        logger = setup_logging(log_file, console_level=console_level, file_level=logging.DEBUG)
+        logger = setup_logging(log_file, console_level=console_level, file_level=logging.DEBUG,
+                               queue_size=max(0, args.log_queue), queue_policy=args.log_queue_policy)
 
         # optional dedupe root: if user provides --dst, we use it; else None
         dedupe_root = Path(args.dst) if args.dst else None
 
-        rc = run_replay(
+        if args.no_hash_cache:
+            hash_cache = None
+        elif args.hash_cache:
+            hash_cache = Path(args.hash_cache)
+        elif dedupe_root is not None:
+            hash_cache = _default_hash_cache_for_normal(dedupe_root)
+        else:
+            hash_cache = plan_in.with_name("hash_cache.json")
+
+        rc = _call(
+            _profile_path(args.profile, log_file),
+            run_replay,
             plan_in,
             logger,
             on_conflict=args.on_conflict,
             dedupe=bool(args.dedupe),
+            dedupe_action=args.dedupe_action,
             dry_run=bool(args.dry_run),
             plan_out=plan_out,
             plan_fsync=bool(args.plan_fsync),
+            plan_batch=max(1, args.plan_batch),
+            plan_batch_ms=max(0, args.plan_batch_ms),
             dedupe_root=dedupe_root,
+            hash_cache=hash_cache,
+            hash_workers=max(1, args.hash_workers),
+            dedupe_spill=max(0, args.dedupe_spill),
+            hash_algo=args.hash_algo,
+            run_id_in=args.run_id or None,
+            workers=max(1, args.workers),
+            progress_every=max(0.0, args.progress_every),
+            scan_snapshot=_default_scan_snapshot(dedupe_root) if args.incremental_scan and dedupe_root else None,
         )
         raise SystemExit(rc)
 
@@ -100,13 +293,17 @@ def main() -> None:
     # -----------------------
     if args.undo:
         plan_in = Path(args.undo)
+        _check_run_id(ap, plan_in, args.run_id)
         plan_out = Path(args.plan_out) if args.plan_out else _default_plan_out_for_plan(plan_in, "undo")
         log_file = Path(args.log_file) if args.log_file else _default_log_file_for_plan(plan_in, "undo")
-        logger = setup_logging(log_file, console_level=console_level, file_level=logging.DEBUG)
+        logger = setup_logging(log_file, console_level=console_level, file_level=logging.DEBUG,
+                               queue_size=max(0, args.log_queue), queue_policy=args.log_queue_policy)
 
         trash_dir = Path(args.trash_dir) if args.trash_dir else None
 
-        rc = run_undo(
+        rc = _call(
+            _profile_path(args.profile, log_file),
+            run_undo,
             plan_in,
             logger,
             on_conflict=args.on_conflict,
@@ -114,20 +311,45 @@ def main() -> None:
             trash_dir=trash_dir,
             plan_out=plan_out,
             plan_fsync=bool(args.plan_fsync),
+            plan_batch=max(1, args.plan_batch),
+            plan_batch_ms=max(0, args.plan_batch_ms),
+            run_id_in=args.run_id or None,
+            workers=max(1, args.workers),
+            progress_every=max(0.0, args.progress_every),
         )
         raise SystemExit(rc)
 
     # -----------------------
-    # normal mode
+    # normal mode (or --resume)
     # -----------------------
+    resume_state = None
+    if args.resume:
+        resume_state = load_resume_state(Path(args.resume))
+        if resume_state.ended:
+            ap.error(f"--resume: run {resume_state.run_id} in {args.resume} already finished (RUN_END); "
+                     "start a new run instead")
+        _apply_resumed_settings(args, resume_state)
+        args.plan_out = args.resume
+
+    if args.watch and args.resume:
+        ap.error("--watch cannot be combined with --resume")
     if not args.src or not args.dst:
-        ap.error("--src and --dst are required unless you use --replay or --undo")
+        ap.error("--src and --dst are required unless you use --replay, --undo or --stats")
 
     src = Path(args.src)
     dst = Path(args.dst)
+    try:
+        mtime_after = parse_time_bound(args.mtime_after)
+        mtime_before = parse_time_bound(args.mtime_before)
+    except ValueError as e:
+        ap.error(f"bad --mtime-after/--mtime-before: {e}")
 
     plan_out = Path(args.plan_out) if args.plan_out else _default_plan_out_for_normal(dst)
     log_file = Path(args.log_file) if args.log_file else _default_log_file_for_normal(dst)
+    if args.no_hash_cache:
+        hash_cache = None
+    else:
+        hash_cache = Path(args.hash_cache) if args.hash_cache else _default_hash_cache_for_normal(dst)
 
     cfg = RunConfig(
         src=src,
@@ -136,20 +358,45 @@ def main() -> None:
         mode=args.mode,
         action=args.action,
         dry_run=bool(args.dry_run),
+        workers=max(1, args.workers),
+        watch=bool(args.watch),
+        watch_interval=max(0.1, args.watch_interval),
+        watch_quiet=max(0.0, args.watch_quiet),
         only_ext=parse_ext_list(args.only_ext),
         exclude_ext=parse_ext_list(args.exclude_ext),
         min_size_kb=int(args.min_size_kb),
+        max_size_kb=int(args.max_size_kb),
+        include=tuple(args.include),
+        exclude=tuple(args.exclude),
+        exclude_dir=tuple(args.exclude_dir),
+        mtime_after=mtime_after,
+        mtime_before=mtime_before,
+        skip_log=args.skip_log,
         on_conflict=args.on_conflict,
         dedupe=bool(args.dedupe),
+        dedupe_action=args.dedupe_action,
+        store=args.store,
+        hash_cache=hash_cache,
+        hash_workers=max(1, args.hash_workers),
+        dedupe_spill=max(0, args.dedupe_spill),
+        hash_algo=args.hash_algo,
+        scan_snapshot=_default_scan_snapshot(dst) if args.incremental_scan else None,
         plan_out=plan_out,
+        resume=Path(args.resume) if args.resume else None,
         plan_fsync=bool(args.plan_fsync),
+        plan_batch=max(1, args.plan_batch),
+        plan_batch_ms=max(0, args.plan_batch_ms),
         log_file=log_file,
         console_level=console_level,
         file_level=logging.DEBUG,
+        log_queue=max(0, args.log_queue),
+        log_queue_policy=args.log_queue_policy,
+        progress_every=max(0.0, args.progress_every),
     )
 
-    logger = setup_logging(cfg.log_file, console_level=cfg.console_level, file_level=cfg.file_level)
-    rc = run_sort(cfg, logger)
+    logger = setup_logging(cfg.log_file, console_level=cfg.console_level, file_level=cfg.file_level,
+                           queue_size=cfg.log_queue, queue_policy=cfg.log_queue_policy)
+    rc = _call(_profile_path(args.profile, cfg.log_file), run_sort, cfg, logger, resume=resume_state)
     raise SystemExit(rc)
 
 
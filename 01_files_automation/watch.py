@@ -0,0 +1,79 @@
+from __future__ import annotations
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from scanner import FileEntry, scan_files
+
+# in-progress downloads: never "settled", whatever their mtime says
+PARTIAL_EXTS = {"part", "partial", "crdownload", "download", "opdownload"}
+
+_Sig = Tuple[int, int]  # (size, mtime_ns)
+
+
+class FolderWatcher:
+    """
+    Poll a drop folder and report files once they have settled.
+
+    A file is settled when its mtime is at least `quiet_s` old and its
+    (size, mtime) did not change since the previous poll. Files already
+    reported are remembered by signature, so they come back only if they
+    are rewritten (e.g. with --action copy, where the source stays put).
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        recursive: bool,
+        quiet_s: float = 10.0,
+        interval_s: float = 2.0,
+        skip_dir: Optional[Callable[[str], bool]] = None,
+    ) -> None:
+        self.root = root
+        self.recursive = recursive
+        self.skip_dir = skip_dir
+        self.quiet_s = quiet_s
+        self.interval_s = interval_s
+        self._seen: Dict[str, _Sig] = {}
+        self._reported: Dict[str, _Sig] = {}
+
+    def poll(self) -> List[FileEntry]:
+        now = time.time()
+        seen: Dict[str, _Sig] = {}
+        ready: List[FileEntry] = []
+        for fe in scan_files(self.root, self.recursive, skip_dir=self.skip_dir):
+            if fe.path.suffix.lower().lstrip(".") in PARTIAL_EXTS:
+                continue
+            try:
+                st = fe.stat()
+            except OSError:
+                continue
+            key = str(fe.path)
+            sig = (st.st_size, st.st_mtime_ns)
+            seen[key] = sig
+            if self._reported.get(key) == sig:
+                continue
+            prev = self._seen.get(key)
+            if prev is not None and prev != sig:
+                continue
+            if now - st.st_mtime < self.quiet_s:
+                continue
+            self._reported[key] = sig
+            ready.append(fe)
+        # forget files that are gone (moved away by us, or deleted)
+        self._seen = seen
+        self._reported = {k: v for k, v in self._reported.items() if k in seen}
+        return ready
+
+    def stream(self, max_polls: Optional[int] = None) -> Iterator[Optional[FileEntry]]:
+        """
+        Yield settled files forever (or for `max_polls` polls). A None is
+        yielded after every poll so the consumer can flush while idle.
+        """
+        polls = 0
+        while max_polls is None or polls < max_polls:
+            if polls:
+                time.sleep(self.interval_s)
+            polls += 1
+            yield from self.poll()
+            yield None